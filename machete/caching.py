@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+from __future__ import (unicode_literals, print_function, division,
+                        absolute_import)
+
+import hashlib
+import threading
+import time
+
+from django.core.cache import caches
+from django.db.models import signals
+
+from . import compat
+
+
+class ResponseCache(object):
+    """
+    Caches encoded GET responses across requests in a Django cache backend.
+
+    Entries are keyed on whatever the endpoint passes as key parts (the
+    resource type, pks, requested fields, query parameters and the absolute
+    URL base by default) combined with a generation counter for every
+    resource type the response depends on. Invalidating a type bumps its
+    counter, which makes every entry built with the old value unreachable
+    without scanning for keys; those simply expire.
+
+    Set an instance as ``response_cache`` on an endpoint. Use ``watch`` to
+    invalidate on writes that bypass the API. Invalidation happens once the
+    transaction commits; on Django < 1.9 that's only known for writes
+    through the API, others invalidate right away.
+
+    """
+
+    def __init__(self, alias='default', timeout=300, key_prefix='machete'):
+        self.alias = alias
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def stats(self):
+        """Returns the hit and miss counters of this process."""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'ratio': hits / total if total else 0.0,
+        }
+
+    def get_generation_key(self, resource_type):
+        return '%s:generation:%s' % (self.key_prefix, resource_type)
+
+    def new_generation(self):
+        """
+        Returns the first value of a counter. It's unique (the current time
+        in microseconds) so a counter that got evicted doesn't restart at
+        a value entries were built with before.
+
+        """
+        return int(time.time() * 1000000)
+
+    def get_generations(self, resource_types):
+        keys = [self.get_generation_key(t) for t in resource_types]
+        cache = self.cache
+        generations = cache.get_many(keys)
+        missing = [key for key in keys if key not in generations]
+        if missing:
+            for key in missing:
+                cache.add(key, self.new_generation(), None)
+            # Another process may have added the counter first
+            generations.update(cache.get_many(missing))
+        return [generations.get(key) or self.new_generation() for key in keys]
+
+    def invalidate(self, resource_type):
+        """Invalidates all cached responses depending on ``resource_type``."""
+        key = self.get_generation_key(resource_type)
+        cache = self.cache
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Missing (or evicted) counter
+            cache.set(key, self.new_generation(), None)
+
+    def make_key(self, parts, resource_types):
+        resource_types = sorted(set(resource_types))
+        generations = self.get_generations(resource_types)
+        versions = ['%s=%s' % v for v in zip(resource_types, generations)]
+        raw = '|'.join(['%s' % p for p in parts] + versions)
+        digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+        return '%s:response:%s' % (self.key_prefix, digest)
+
+    def get(self, key):
+        entry = self.cache.get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def set(self, key, status, content_type, body, etag=None):
+        entry = {
+            'status': status,
+            'content_type': content_type,
+            'body': body,
+            'etag': etag,
+        }
+        self.cache.set(key, entry, self.timeout)
+
+    def watch(self, model, resource_type):
+        """
+        Invalidates ``resource_type`` whenever an instance of ``model`` is
+        saved or deleted, or one of its many to many relations changes.
+
+        """
+        def invalidate(sender, **kwargs):
+            compat.on_commit(lambda: self.invalidate(resource_type),
+                             using=kwargs.get('using'))
+
+        uid = 'machete-response-cache-%s-%s' % (id(self), resource_type)
+        signals.post_save.connect(invalidate, sender=model, weak=False,
+                                  dispatch_uid=uid)
+        signals.post_delete.connect(invalidate, sender=model, weak=False,
+                                    dispatch_uid=uid)
+        for field in model._meta.many_to_many:
+            through = compat.get_remote_field(field).through
+            signals.m2m_changed.connect(invalidate, sender=through,
+                                        weak=False, dispatch_uid=uid)
+
+
+class FragmentCache(object):
+    """
+    Caches the marshalled dict (including the ``links``) of every resource
+    of a collection in a Django cache backend.
+
+    Entries are keyed on the resource type, the pk, the value of the
+    ``version_field`` of the row (e.g. an ``updated_at`` timestamp or a
+    version counter), the requested fields and the absolute URL base. Rows
+    with a new version simply miss. Make sure the version changes whenever
+    the output of the resource does, links included.
+
+    Set an instance as ``fragment_cache`` on an endpoint. Collections then
+    fetch the fragments of all rows with a single ``get_many`` and only
+    marshal the misses. ``stats`` reports the hit ratio and an estimate of
+    the marshalling time saved.
+
+    """
+
+    def __init__(self, version_field, alias='default', timeout=3600,
+                 key_prefix='machete'):
+        self.version_field = version_field
+        self.alias = alias
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self.hits = 0
+        self.misses = 0
+        self.marshal_time = 0.0
+        self.fetch_time = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def stats(self):
+        """
+        Returns the hit and miss counters of this process and the time the
+        hits saved: the average time marshalling a miss took for every hit,
+        minus the time spent fetching fragments.
+
+        """
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            marshal_time, fetch_time = self.marshal_time, self.fetch_time
+        total = hits + misses
+        per_miss = marshal_time / misses if misses else 0.0
+        return {
+            'hits': hits,
+            'misses': misses,
+            'ratio': hits / total if total else 0.0,
+            'saved': hits * per_miss - fetch_time,
+        }
+
+    def get_value(self, obj, name):
+        # Rows can be dicts fetched with values()
+        if isinstance(obj, dict):
+            return obj.get(name)
+        return getattr(obj, name, None)
+
+    def make_key(self, resource_type, obj, parts):
+        """
+        Returns the key of the fragment of ``obj`` or ``None`` when it has
+        no version.
+
+        """
+        version = self.get_value(obj, self.version_field)
+        if version is None:
+            return None
+        pk = self.get_value(obj, 'pk')
+        raw = '|'.join('%s' % p for p in [resource_type, pk, version] + parts)
+        digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+        return '%s:fragment:%s' % (self.key_prefix, digest)
+
+    def get_many(self, keys):
+        """Returns the cached fragments for ``keys`` (``None`` misses)."""
+        cacheable = [key for key in keys if key is not None]
+        start = time.time()
+        found = self.cache.get_many(cacheable) if cacheable else {}
+        elapsed = time.time() - start
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+            self.fetch_time += elapsed
+        return found
+
+    def set_many(self, fragments, marshal_time=0.0):
+        """
+        Stores the ``fragments`` (a dict by key) taking ``marshal_time`` to
+        marshal.
+
+        """
+        fragments = dict((k, v) for k, v in fragments.items() if k is not None)
+        if fragments:
+            self.cache.set_many(fragments, self.timeout)
+        with self._lock:
+            self.marshal_time += marshal_time
@@ -4,8 +4,15 @@
 from __future__ import (unicode_literals, print_function, division,
                         absolute_import)
 
+import threading
+import warnings
+from contextlib import contextmanager
 from itertools import chain
 
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction, connections, router
+from django.db.models import AutoField, Max, Case, When, Value
+
 
 def get_all_field_names(opts):
     return list(set(chain.from_iterable(
@@ -20,3 +27,288 @@ def get_field_by_name(opts, name):
     model = field.model
     direct = not field.auto_created or field.concrete
     return field, model, direct, field.many_to_many
+
+
+def get_related_lookup(opts, accessor_name):
+    """
+    Finds the to-many relation exposed as ``accessor_name`` on instances.
+
+    Returns a ``(related_model, lookup)`` tuple in which ``lookup`` is the
+    name to use when filtering ``related_model`` to get back to the model
+    described by ``opts``, or ``None`` when there's no such relation.
+
+    """
+    for field in opts.get_fields():
+        if not (field.one_to_many or field.many_to_many):
+            continue
+        if field.auto_created and not field.concrete:
+            if field.get_accessor_name() == accessor_name:
+                return field.related_model, field.field.name
+        elif field.many_to_many and field.concrete:
+            if field.name == accessor_name:
+                return field.related_model, field.related_query_name()
+    return None
+
+
+def get_to_one_lookup(opts, attribute):
+    """
+    Turns a (dotted) ``attribute`` following to-one relations, like
+    ``post.author``, into a lookup for ``select_related`` (``post__author``).
+
+    Returns ``None`` when some part isn't a to-one relation.
+
+    """
+    parts = attribute.split('.')
+    for part in parts:
+        try:
+            field = opts.get_field(part)
+        except FieldDoesNotExist:
+            return None
+        if not (field.many_to_one or field.one_to_one):
+            return None
+        if field.related_model is None:
+            # Generic foreign key
+            return None
+        opts = field.related_model._meta
+    return '__'.join(parts)
+
+
+def get_prefetched(related):
+    """
+    Returns the objects ``prefetch_related`` cached for the related manager
+    ``related`` or ``None`` when they weren't prefetched.
+
+    """
+    get_queryset = getattr(related, 'get_queryset', None)
+    if get_queryset is None:
+        return None
+    # A prefetched manager hands out the evaluated queryset
+    return getattr(get_queryset(), '_result_cache', None)
+
+
+def get_prefetch_lookups(queryset):
+    """
+    Returns the paths ``queryset`` already prefetches, either passed as
+    strings or as ``Prefetch`` objects.
+
+    """
+    lookups = getattr(queryset, '_prefetch_related_lookups', ())
+    return set(getattr(lookup, 'prefetch_to', lookup) for lookup in lookups)
+
+
+def get_remote_field(field):
+    """``field.rel`` was renamed to ``field.remote_field`` in Django 1.9."""
+    if hasattr(field, 'remote_field'):
+        return field.remote_field
+    return field.rel
+
+
+def get_foreign_key_attname(opts, name, target_field_name='pk'):
+    """
+    Finds the local column holding the value of ``target_field_name`` on the
+    object the to-one relation ``name`` points to (e.g. ``author_id`` for
+    ``author`` and ``pk``).
+
+    Returns ``None`` when ``name`` isn't a concrete foreign key (or one to
+    one) or when it points to another field than ``target_field_name``.
+
+    """
+    try:
+        field = opts.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    if not field.concrete or not (field.many_to_one or field.one_to_one):
+        return None
+    targets = field.foreign_related_fields
+    if len(targets) != 1:
+        return None
+    target = targets[0]
+    if target_field_name == target.name:
+        return field.attname
+    if target_field_name == 'pk' and target.primary_key:
+        return field.attname
+    return None
+
+
+def get_deferred_fields(obj):
+    """
+    Returns the attnames of the fields of ``obj`` that haven't been loaded.
+
+    ``Model.get_deferred_fields`` keeps reporting deferred fields after
+    they've been loaded lazily on Django < 1.10.
+
+    """
+    return set(f.attname for f in obj._meta.concrete_fields
+               if f.attname not in obj.__dict__)
+
+
+def get_row_pk_key(queryset):
+    """
+    Tells how to read the primary key of the rows of ``queryset`` for
+    keyset queries on it: ``'pk'`` for model instances, the key of the
+    primary key for ``values()`` dicts or ``None`` when the rows don't hold
+    it (e.g. ``values_list()`` tuples).
+
+    Querysets yield rows through a ``_iterable_class`` since Django 1.9 and
+    are ``ValuesQuerySet`` subclasses before.
+
+    """
+    from django.db.models import query
+    iterable_class = getattr(queryset, '_iterable_class', None)
+    if iterable_class is not None:
+        if iterable_class is query.ModelIterable:
+            return 'pk'
+        if iterable_class is not query.ValuesIterable:
+            return None
+    elif isinstance(queryset, getattr(query, 'ValuesListQuerySet', ())):
+        return None
+    elif not isinstance(queryset, getattr(query, 'ValuesQuerySet', ())):
+        return 'pk'
+    pk = queryset.model._meta.pk
+    fields = getattr(queryset, '_fields', None)
+    if not fields:
+        return pk.attname
+    for name in ('pk', pk.attname, pk.name):
+        if name in fields:
+            return name
+    return None
+
+
+_deferred = threading.local()
+
+
+def on_commit(func, using=None):
+    """
+    Runs ``func`` once the current transaction commits.
+
+    Django versions without ``transaction.on_commit`` (< 1.9) can't tell,
+    so ``func`` runs when the enclosing ``deferred_on_commit`` block exits
+    or right away outside of one.
+
+    """
+    if hasattr(transaction, 'on_commit'):
+        transaction.on_commit(func, using=using)
+        return
+    funcs = getattr(_deferred, 'funcs', None)
+    if funcs is not None and transaction.get_connection(using).in_atomic_block:
+        funcs.append(func)
+    else:
+        func()
+
+
+@contextmanager
+def deferred_on_commit():
+    """
+    Collects the callables passed to ``on_commit`` within atomic blocks in
+    the enclosed code and runs them once it exits without an error, after
+    an enclosed ``transaction.atomic`` committed. Only needed on Django
+    versions without ``transaction.on_commit`` (< 1.9).
+
+    """
+    if hasattr(transaction, 'on_commit') or \
+            getattr(_deferred, 'funcs', None) is not None:
+        yield
+        return
+    _deferred.funcs = funcs = []
+    try:
+        yield
+    finally:
+        _deferred.funcs = None
+    for func in funcs:
+        func()
+
+
+def bulk_insert(model, objs, batch_size=None):
+    """
+    Inserts ``objs`` in order using ``bulk_create`` and makes sure every
+    object has its primary key afterwards.
+
+    ``bulk_create`` only sets generated primary keys on databases that can
+    return them (PostgreSQL on Django >= 1.10). On older versions
+    PostgreSQL gets the keys of auto fields upfront from their sequence in
+    a single query. SQLite allows a single writer, so the keys of each
+    batch are the highest ones right after inserting it. Other databases
+    (like MySQL) fall back to saving the objects one by one, with a
+    ``RuntimeWarning``.
+
+    """
+    if not objs:
+        return objs
+    using = router.db_for_write(model)
+    manager = model._default_manager.db_manager(using)
+    pk_attname = model._meta.pk.attname
+    pks = [getattr(obj, pk_attname) for obj in objs]
+    if all(pk is not None for pk in pks):
+        manager.bulk_create(objs, batch_size=batch_size)
+        return objs
+    connection = connections[using]
+    if getattr(connection.features, 'can_return_ids_from_bulk_insert', False):
+        manager.bulk_create(objs, batch_size=batch_size)
+        return objs
+    auto_pk = isinstance(model._meta.pk, AutoField)
+    if connection.vendor == 'postgresql' and auto_pk and \
+            all(pk is None for pk in pks):
+        for obj, pk in zip(objs, get_next_pks(connection, model, len(objs))):
+            setattr(obj, pk_attname, pk)
+        manager.bulk_create(objs, batch_size=batch_size)
+        return objs
+    if connection.vendor == 'sqlite' and all(pk is None for pk in pks):
+        size = batch_size or len(objs)
+        for start in range(0, len(objs), size):
+            batch = objs[start:start + size]
+            manager.bulk_create(batch)
+            last = manager.aggregate(last=Max('pk'))['last']
+            for offset, obj in enumerate(batch):
+                setattr(obj, pk_attname, last - len(batch) + 1 + offset)
+        return objs
+    warnings.warn('Inserting %s one by one: the %s database can\'t '
+                  'return the generated primary keys of a bulk insert' % (
+                      model._meta.object_name, connection.vendor),
+                  RuntimeWarning)
+    for obj in objs:
+        obj.save(force_insert=True, using=using)
+    return objs
+
+
+def get_next_pks(connection, model, count):
+    """
+    Reserves ``count`` values of the sequence behind the auto primary key
+    of ``model`` on PostgreSQL, in a single query.
+
+    """
+    opts = model._meta
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+            'FROM generate_series(1, %s)',
+            [connection.ops.quote_name(opts.db_table), opts.pk.column, count])
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def bulk_update(model, objs, fields, batch_size=None):
+    """
+    Writes the values of ``fields`` of ``objs`` with one query per batch.
+
+    Uses ``QuerySet.bulk_update`` on Django >= 2.2 and the same ``CASE``
+    expressions it builds on older versions.
+
+    """
+    if not objs or not fields:
+        return
+    manager = model._default_manager.db_manager(router.db_for_write(model))
+    if hasattr(manager, 'bulk_update'):
+        manager.bulk_update(objs, fields, batch_size=batch_size)
+        return
+    fields = [model._meta.get_field(name) for name in fields]
+    connection = connections[manager.db]
+    # Every row takes two parameters per field (its pk and the value)
+    max_batch_size = connection.ops.bulk_batch_size(['pk', 'pk'] + fields, objs)
+    size = min(batch_size, max_batch_size) if batch_size else max_batch_size
+    for start in range(0, len(objs), size):
+        batch = objs[start:start + size]
+        updates = {}
+        for field in fields:
+            whens = [When(pk=obj.pk, then=Value(getattr(obj, field.attname), output_field=field))
+                     for obj in batch]
+            updates[field.attname] = Case(*whens, output_field=field)
+        manager.filter(pk__in=[obj.pk for obj in batch]).update(**updates)
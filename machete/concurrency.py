@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Overlapping independent database work within a request.
+
+An ``Executor`` runs queries on a bounded pool of threads, so a request
+waits for the slowest of them instead of their sum (the fetches of the
+linked types of a compound document, or the ETag query of a related
+endpoint next to the fetch of the parent resource). Every pool thread
+uses its own database connections, which are closed after each task
+unless ``CONN_MAX_AGE`` allows keeping them, like Django does at the end
+of a request.
+
+Work can't be moved to other connections when it has to see uncommitted
+changes (inside ``transaction.atomic``, which includes the writes of the
+API and ``TestCase``) or when other connections see another database
+(in-memory SQLite). ``Executor.is_enabled`` tells and callers run the
+work inline then.
+
+"""
+from __future__ import (unicode_literals, print_function, division,
+                        absolute_import)
+
+import threading
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.db import connections, close_old_connections
+
+
+__all__ = ['Executor', 'Task']
+
+
+def run_task(func, args, kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+class Task(object):
+    """The pending result of a callable passed to ``Executor.submit``."""
+
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        """Waits for the callable and returns its result (or raises)."""
+        return self._result.get()
+
+
+class InlineTask(Task):
+    """A ``Task`` that ran in the calling thread."""
+
+    def __init__(self, func, args, kwargs):
+        try:
+            self._value = func(*args, **kwargs)
+            self._error = None
+        except Exception as error:
+            self._error = error
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class Executor(object):
+    """
+    Runs callables on at most ``max_workers`` threads (the
+    ``MACHETE_EXECUTOR_WORKERS`` setting, 4 by default).
+
+    Set ``enabled`` to ``False`` to run everything inline. Set an instance
+    as ``executor`` on an endpoint to use it for both; instances can be
+    shared.
+
+    """
+
+    def __init__(self, max_workers=None, enabled=True):
+        if max_workers is None:
+            max_workers = getattr(settings, 'MACHETE_EXECUTOR_WORKERS', 4)
+        self.max_workers = max_workers
+        self.enabled = enabled
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPool(self.max_workers)
+        return self._pool
+
+    def is_enabled(self, using='default'):
+        """
+        Tells whether work for the database ``using`` can run on other
+        connections.
+
+        """
+        if not self.enabled or self.max_workers < 1:
+            return False
+        connection = connections[using]
+        if connection.in_atomic_block:
+            return False
+        if connection.vendor == 'sqlite':
+            name = connection.settings_dict.get('NAME') or ''
+            if name == ':memory:' or 'mode=memory' in name:
+                return False
+        return True
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Schedules ``func(*args, **kwargs)`` and returns a ``Task``. The
+        call happens right away in the calling thread when the executor
+        isn't enabled for the default database.
+
+        """
+        if not self.is_enabled():
+            return InlineTask(func, args, kwargs)
+        return Task(self.pool.apply_async(run_task, (func, args, kwargs)))
+
+    def map(self, func, items, using='default'):
+        """
+        Returns ``[func(item) for item in items]``, calling ``func``
+        concurrently when enabled for ``using``. The order of the results
+        matches ``items``.
+
+        """
+        items = list(items)
+        if len(items) < 2 or not self.is_enabled(using):
+            return [func(item) for item in items]
+        results = [self.pool.apply_async(run_task, (func, (item,), {}))
+                   for item in items]
+        return [result.get() for result in results]
+
+    def shutdown(self):
+        """Stops the threads; the next task starts a new pool."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
@@ -3,23 +3,28 @@ from __future__ import (unicode_literals, print_function, division,
                         absolute_import)
 
 import sys
-import hashlib
 from contextlib import contextmanager
 
 from django.views.decorators.csrf import csrf_exempt
 from django.db import transaction, models
 from django.views.generic import View
-from django.core.exceptions import ImproperlyConfigured
+from django.core.exceptions import ImproperlyConfigured, FieldDoesNotExist
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, StreamingHttpResponse, Http404
 from django.utils.http import quote_etag, parse_etags
 
-from .serializers import serialize
+from .serializers import (serialize, stream, registry, parse_include,
+                          filter_fields, get_required_columns,
+                          get_values_columns, load_related)
 from .urls import create_resource_view_name
+from .identity import identity_map, get_identity_map
 from .exceptions import (JsonApiError, MissingRequestBody, InvalidDataFormat,
-                         IdMismatch, FormValidationError)
+                         IdMismatch, FormValidationError, InvalidPage,
+                         InvalidInclude)
 from .utils import (RequestContext, RequestWithResourceContext, pluck_ids,
                     RequestPayloadDescriptor)
+from .etags import AttributeETag
+from .vendor.marshmallow.exceptions import RegistryError
 from . import compat, json
 
 
@@ -51,6 +56,18 @@ class GetEndpoint(View):
     filter_class = None
     include_link_to_self = False
     etag_attribute = None
+    etag_strategy = None
+    streaming = False
+    stream_chunk_size = 500
+    pagination_class = None
+    fetch_values = False
+    eager_links = True
+    identity_map_size = None
+    response_cache = None
+    fragment_cache = None
+    executor = None
+    json_backend = None
+    pretty_print = False
 
     def __init__(self, *args, **kwargs):
         super(GetEndpoint, self).__init__(*args, **kwargs)
@@ -73,8 +90,13 @@ class GetEndpoint(View):
         self.kwargs = kwargs
         manager, m_args, m_kwargs = self.context_manager()
         try:
-            with manager(*m_args, **m_kwargs):
-                return super(GetEndpoint, self).dispatch(request, *args, **kwargs)
+            # Instances loaded for the primary data, related and linked
+            # resources of the request share one identity map
+            with identity_map(self.identity_map_size):
+                # Invalidations wait for the transaction on Django < 1.9
+                with compat.deferred_on_commit():
+                    with manager(*m_args, **m_kwargs):
+                        return super(GetEndpoint, self).dispatch(request, *args, **kwargs)
         except Exception as error:
             et, ei, tb = sys.exc_info()
             return self.handle_error(error, tb)
@@ -98,6 +120,11 @@ class GetEndpoint(View):
 
     def get(self, request, *args, **kwargs):
         self.context = self.create_get_context(request)
+        cache_key = self.get_response_cache_key()
+        if cache_key:
+            response = self.get_cached_response(cache_key)
+            if response is not None:
+                return response
         if not self.has_etag_changed():
             content_type = self.get_content_type()
             return HttpResponse(status=304, content_type=content_type)
@@ -107,14 +134,19 @@ class GetEndpoint(View):
         else:
             data = self.get_resources()
             collection = True
-        return self.create_http_response(data, collection=collection, compound=True)
+        response = self.create_http_response(data, collection=collection, compound=True)
+        if cache_key:
+            self.cache_response(cache_key, response)
+        return response
 
     def has_etag_changed(self):
-        if not self.etag_attribute:
-            return True
         etag = self.generate_etag()
         if not etag:
             return True
+        return not self.matches_etag(etag)
+
+    def matches_etag(self, etag):
+        """Checks the If-None-Match header of the request."""
         match = self.request.META.get('HTTP_IF_NONE_MATCH')
         if match:
             values = parse_etags(match)
@@ -122,16 +154,154 @@ class GetEndpoint(View):
                 # Django appends ";gzip" when gzip is enabled
                 clean_value = value.split(';')[0]
                 if clean_value == '*' or clean_value == etag:
-                    return False
-        return True
+                    return True
+        return False
 
-    def generate_etag(self):
-        if not self.etag_attribute:
+    def get_response_cache_key(self):
+        """
+        Determines the key of the response in the ``response_cache``.
+
+        Returns ``None`` when responses shouldn't be cached.
+
+        """
+        if self.response_cache is None:
+            return None
+        parts = self.get_response_cache_key_parts()
+        return self.response_cache.make_key(parts, self.get_response_cache_dependencies())
+
+    def get_response_cache_key_parts(self):
+        """
+        Returns everything the response depends on besides the data.
+
+        Extend this when responses vary on anything else, e.g. the user.
+
+        """
+        request = self.request
+        fields = self.context.resource_descriptor.fields or []
+        params = sorted((k, sorted(request.GET.getlist(k))) for k in request.GET)
+        return [self.get_resource_type(), ','.join(self.context.pks),
+                ','.join(fields), params, request.build_absolute_uri('/')]
+
+    def get_response_cache_dependencies(self):
+        """
+        Returns the resource types whose changes invalidate the response:
+        the resource type itself and every type it links to (those end up
+        in the compound document), following the ``include`` paths.
+
+        """
+        name = self.get_resource_type()
+        dependencies = [name]
+        include = self.context.resource_descriptor.include
+        if include is None:
+            try:
+                links = registry.get_class(name)._declared_fields.get('links')
+            except RegistryError:
+                return dependencies
+            include = links.link_fields.keys() if links is not None else []
+        for path in include:
+            try:
+                serializer_class = registry.get_class(name)
+                for part in path.split('.'):
+                    links = serializer_class._declared_fields['links']
+                    rel_type = links.link_fields[part].get_relation_type()
+                    dependencies.append(rel_type)
+                    serializer_class = registry.get_class(rel_type)
+            except RegistryError:
+                continue
+        return dependencies
+
+    def get_cached_response(self, cache_key):
+        entry = self.response_cache.get(cache_key)
+        if entry is None:
             return None
+        content_type = entry['content_type']
+        etag = entry['etag']
+        if etag and self.matches_etag(etag):
+            return HttpResponse(status=304, content_type=content_type)
+        response = HttpResponse(entry['body'], content_type=content_type, status=entry['status'])
+        # Reuse the cached ETag instead of querying it again
+        self.context.etag = etag
+        self.context.etag_generated = True
+        collection = not self.context.requested_single_resource
+        return self.postprocess_response(response, None, None, collection)
+
+    def cache_response(self, cache_key, response):
+        if response.streaming or response.status_code != 200:
+            return
+        etag = self.context.etag if self.context.etag_generated else None
+        self.response_cache.set(cache_key, response.status_code, response['Content-Type'], response.content, etag)
+
+    def invalidate_cached_responses(self):
+        """
+        Invalidates the cached responses of this resource type once the
+        current transaction commits.
+
+        """
+        if self.response_cache is None:
+            return
+        resource_type = self.resource_name
+        compat.on_commit(lambda: self.response_cache.invalidate(resource_type))
+
+    def generate_etag(self):
+        """
+        Generates the ETag using the ``etag_strategy``.
+
+        The result is memoized on the context: it's computed once per
+        request, even though both ``has_etag_changed`` and
+        ``postprocess_response`` need it.
+
+        """
+        if self.context.etag_generated:
+            return self.context.etag
+        strategy = self.get_etag_strategy()
+        etag = None
+        if self.context.etag_task is not None:
+            etag = self.context.etag_task.result()
+        elif strategy is not None:
+            etag = strategy.generate(self.get_filtered_queryset())
+        self.context.etag = etag
+        self.context.etag_generated = True
+        return etag
+
+    def start_etag(self):
+        """
+        Starts generating the ETag on the ``executor`` so its query
+        overlaps with the queries preceding the fetch of the resources.
+        Only related endpoints have such queries (loading the parent
+        resource) and call it. Call ``generate_etag`` before fetching the
+        resources: an ETag computed while they're fetched could see a
+        newer write than the body and get paired with stale content.
+
+        Conditional requests (with an ``If-None-Match`` header) compute it
+        first instead, since it decides whether anything gets fetched.
+
+        """
+        executor = self.executor
+        strategy = self.get_etag_strategy()
+        if executor is None or strategy is None:
+            return
+        if self.request.META.get('HTTP_IF_NONE_MATCH'):
+            return
         qs = self.get_filtered_queryset()
-        values = qs.values_list(self.etag_attribute, flat=True)
-        etag = ','.join('%s' % value for value in values)
-        return hashlib.md5(etag).hexdigest()
+        if not executor.is_enabled(getattr(qs, 'db', 'default')):
+            return
+        self.context.etag_task = executor.submit(strategy.generate, qs)
+
+    def get_etag_strategy(self):
+        """
+        Determines how ETags are computed.
+
+        Set ``etag_strategy`` to an instance of
+        ``machete.etags.ETagStrategy`` or ``etag_attribute`` to hash the
+        values of that attribute. Returns ``None`` when no ETag should be
+        generated.
+
+        """
+        if self.etag_strategy is not None:
+            return self.etag_strategy
+        if self.etag_attribute:
+            return AttributeETag(self.etag_attribute)
+        return None
 
     def create_http_response(self, data, collection=False, compound=False):
         """
@@ -149,18 +319,63 @@ class GetEndpoint(View):
         if isinstance(data, HttpResponse):
             # No more processing necessary
             return data
+        if collection and self.should_stream(data):
+            return self.create_streaming_http_response(data, compound=compound)
         if isinstance(data, dict):
             # How nice. Use it!
             response_data = data
         else:
             # Everything else: run it through the serialization process
             response_data = self.serialize(data, collection=collection, compound=compound)
-        json_data = self.create_json(response_data, indent=2)
+        json_data = self.create_json(response_data, indent=self.get_json_indent())
         status = self.context.status
         content_type = self.get_content_type()
         response = HttpResponse(json_data, content_type=content_type, status=status)
         return self.postprocess_response(response, data, response_data, collection)
 
+    def should_stream(self, data):
+        """
+        Determines whether a collection is streamed to the client.
+
+        Enable streaming by setting ``streaming`` on the class. Only GET
+        requests for querysets are streamed.
+
+        """
+        if not self.streaming or self.request.method != 'GET':
+            return False
+        return hasattr(data, 'iterator')
+
+    def create_streaming_http_response(self, data, compound=False):
+        """
+        Creates a streaming HTTP response for a collection.
+
+        The queryset is fetched and serialized in chunks of
+        ``stream_chunk_size`` while the response is being sent. Memory
+        usage only stays independent of the size of the collection when
+        the queryset is ordered on the primary key (or not at all): those
+        are fetched with a keyset query per chunk (see
+        ``machete.utils.chunked``).
+
+        """
+        content = self.stream_serialize(data, compound=compound)
+        status = self.context.status
+        content_type = self.get_content_type()
+        response = StreamingHttpResponse(content, content_type=content_type, status=status)
+        return self.postprocess_response(response, data, None, True)
+
+    def stream_serialize(self, data, compound=False):
+        """
+        Serializes a collection in parts. See ``serialize``.
+
+        """
+        name = self.get_resource_type()
+        context = self.context.__dict__
+        self_link = self.include_link_to_self
+        fields = self.context.resource_descriptor.fields
+        only = fields if fields else None
+        include = self.context.resource_descriptor.include
+        return stream(name, data, self.create_json, chunk_size=self.stream_chunk_size, compound=compound, context=context, self_link=self_link, only=only, include=include, fragment_cache=self.fragment_cache, executor=self.executor)
+
     def serialize(self, data, collection=False, compound=False):
         """
         Serializes the data.
@@ -174,7 +389,16 @@ class GetEndpoint(View):
         self_link = self.include_link_to_self
         fields = self.context.resource_descriptor.fields
         only = fields if fields else None
-        return serialize(name, data, many=collection, compound=compound, context=context, self_link=self_link, only=only)
+        include = self.context.resource_descriptor.include
+        document = serialize(name, data, many=collection, compound=compound, context=context, self_link=self_link, only=only, include=include, fragment_cache=self.fragment_cache, executor=self.executor)
+        self.check_loaded_columns(data, collection)
+        page = self.context.page
+        if collection and page is not None:
+            page.update_document(document, self.request)
+        missing_pks = self.context.missing_pks
+        if collection and missing_pks:
+            document.setdefault('meta', {})['missing'] = missing_pks
+        return document
 
     def get_resource_type(self):
         return self.resource_name
@@ -183,16 +407,20 @@ class GetEndpoint(View):
         # TODO Improve error reporting
         error_object = {}
         if isinstance(error, FormValidationError):
-            errors = []
-            for field, itemized_errors in error.form.errors.items():
-                composite = field == '__all__'
-                for e in itemized_errors:
-                    detail = {'detail': '%s' % e}
-                    if not composite:
-                        detail['member'] = field
-                        detail['member_label'] = '%s' % error.form.fields.get(field).label
-                    errors.append(detail)
+            if error.forms is None:
+                errors = self.get_form_errors(error.form)
+            else:
+                # Errors of multiple resources point to the offending one
+                # by its index in the request body
+                errors = []
+                for index, form in error.forms:
+                    for detail in self.get_form_errors(form):
+                        detail['index'] = index
+                        errors.append(detail)
             return HttpResponse(self.create_json({'errors': errors}), status=400)
+        if isinstance(error, (InvalidPage, InvalidInclude)):
+            error_object['message'] = '%s' % error
+            return HttpResponse(self.create_json({'errors': [error_object]}), status=400)
         if isinstance(error, Http404):
             error_object['message'] = '%s' % error
             return HttpResponse(self.create_json({'errors': [error_object]}), status=404)
@@ -201,11 +429,26 @@ class GetEndpoint(View):
             return HttpResponse(self.create_json({'errors': [error_object]}), status=500)
         raise error.__class__, error, traceback
 
+    def get_form_errors(self, form):
+        errors = []
+        for field, itemized_errors in form.errors.items():
+            composite = field == '__all__'
+            for e in itemized_errors:
+                detail = {'detail': '%s' % e}
+                if not composite:
+                    detail['member'] = field
+                    detail['member_label'] = '%s' % form.fields.get(field).label
+                errors.append(detail)
+        return errors
+
     def postprocess_response(self, response, data, response_data, collection):
         """
         If you need to do any further processing of the HttpResponse
         objects, this is the place to do it.
 
+        Responses served from the ``response_cache`` pass through here as
+        well, with ``data`` and ``response_data`` set to ``None``.
+
         """
         etag = self.generate_etag()
         if etag:
@@ -221,7 +464,13 @@ class GetEndpoint(View):
 
         """
         filter = {self.get_pk_field(): self.context.pk}
-        return self.get_filtered_queryset().get(**filter)
+        resource = self.select_columns(self.get_filtered_queryset()).get(**filter)
+        active = get_identity_map()
+        if active is not None:
+            # Related endpoints don't serialize it but linked loads may
+            # reuse it
+            active.add_many([resource], self.get_pk_field())
+        return resource
 
     def get_resources(self):
         """
@@ -229,19 +478,216 @@ class GetEndpoint(View):
 
         Maps to ``GET /posts/1,2,3`` or ``GET /posts``.
 
+        When pks are given the rows are fetched right away; the 404 and the
+        pks reported as missing are derived from them and the serializer
+        gets the list, so the queryset is evaluated once.
+
         """
-        qs = self.get_filtered_queryset()
-        if self.context.pks:
-            filter = {'%s__in' % self.get_pk_field(): self.context.pks}
-            qs = qs.filter(**filter)
-        if self.context.pks and not qs.exists():
-            raise Http404()
-        return qs
+        qs = self.select_values(self.get_filtered_queryset())
+        if not self.context.pks:
+            return self.paginate_resources(qs)
+        filter = {'%s__in' % self.get_pk_field(): self.context.pks}
+        qs = qs.filter(**filter)
+        if self.get_paginator() is not None:
+            resources = self.paginate_resources(qs)
+        else:
+            resources = list(qs)
+            self.context.missing_pks = self.get_missing_pks(
+                resources, self.context.pks, self.get_pk_field())
+        if not resources:
+            raise Http404('Resources %s not found' % ','.join(self.context.pks))
+        return resources
+
+    def select_columns(self, qs):
+        """
+        Limits the columns ``qs`` loads to the ones the requested ``fields``
+        need, including the foreign keys of the links.
+
+        Nothing changes when no fields were requested or when it's unknown
+        what a serializer field reads (see ``get_required_columns``).
+
+        """
+        fields = self.context.resource_descriptor.fields
+        model = getattr(qs, 'model', None)
+        if not fields or model is None:
+            return qs
+        serializer = self.get_requested_serializer()
+        if serializer is None:
+            return qs
+        columns = get_required_columns(serializer, model._meta)
+        if columns is None:
+            return qs
+        if self.fragment_cache is not None:
+            columns.add(self.fragment_cache.version_field)
+        self.check_columns(columns, model._meta)
+        self.context.columns = columns
+        return qs.only(*columns)
+
+    def check_columns(self, columns, opts):
+        """
+        Makes sure ``only()`` can select all ``columns`` the requested
+        fields need before anything is fetched; a column it can't select
+        would be loaded per object.
+
+        """
+        invalid = []
+        for name in columns:
+            try:
+                field = opts.get_field(name)
+            except FieldDoesNotExist:
+                invalid.append(name)
+                continue
+            if not field.concrete or field.many_to_many:
+                invalid.append(name)
+        if invalid:
+            raise ImproperlyConfigured(
+                'Serializing %s needs the column(s) %s, which aren\'t '
+                'columns of %s; check the columns option of the '
+                'serializer' % (self.get_resource_type(),
+                                ', '.join(sorted(invalid)), opts.object_name))
+
+    def select_values(self, qs):
+        """
+        Fetches plain dicts with ``values()`` instead of model instances
+        when ``fetch_values`` is set and every requested serializer field
+        can read them (see ``get_values_columns``): attributes mapping to
+        columns and links reading a foreign key.
+
+        Falls back to instances limited by ``select_columns`` with their
+        links loaded by ``load_links`` otherwise, e.g. when a ``Method``,
+        ``Function`` or ``HrefField`` field or a link with a ``method`` is
+        requested.
+
+        """
+        model = getattr(qs, 'model', None)
+        if not self.fetch_values or model is None:
+            return self.load_links(self.select_columns(qs))
+        pk_field = self.get_pk_field()
+        serializer = self.get_requested_serializer()
+        columns = None
+        if serializer is not None and '__' not in pk_field:
+            columns = get_values_columns(serializer, model._meta)
+        if columns is None:
+            return self.load_links(self.select_columns(qs))
+        if pk_field not in columns:
+            # Needed for the missing pks and keyset pagination
+            columns.append(pk_field)
+        if self.fragment_cache is not None:
+            for name in ('pk', self.fragment_cache.version_field):
+                if name not in columns:
+                    columns.append(name)
+        return qs.values(*columns)
+
+    def load_links(self, qs):
+        """
+        Adds the ``select_related`` and ``prefetch_related`` lookups the
+        requested links need to be read without a query per resource (see
+        ``get_related_loads``) when ``eager_links`` is set.
+
+        """
+        if not self.eager_links:
+            return qs
+        serializer = self.get_requested_serializer()
+        if serializer is None:
+            return qs
+        return load_related(qs, serializer)
+
+    def get_requested_serializer(self):
+        """
+        Returns a serializer limited to the requested ``fields`` of the
+        resource type or ``None`` when no serializer is registered.
+
+        """
+        try:
+            serializer_class = registry.get_class(self.get_resource_type())
+        except RegistryError:
+            return None
+        fields = self.context.resource_descriptor.fields
+        if not fields:
+            return serializer_class()
+        return serializer_class(only=filter_fields(serializer_class, fields))
+
+    def check_loaded_columns(self, data, collection):
+        """
+        Makes sure serializing ``data`` didn't load any column left out by
+        ``select_columns``, which happens per object. That's only possible
+        when the ``columns`` option of the serializer misses a column a
+        field reads; ``check_columns`` catches everything else before
+        fetching.
+
+        """
+        columns = self.context.columns
+        if columns is None:
+            return
+        if not collection:
+            data = [data]
+        elif getattr(data, '_result_cache', data) is None:
+            return
+        loaded = set()
+        for obj in data:
+            opts = getattr(obj, '_meta', None)
+            if opts is None:
+                # values() rows or fragments
+                continue
+            expected = set(f.attname for f in opts.concrete_fields
+                           if f.name not in columns)
+            loaded |= expected - compat.get_deferred_fields(obj)
+        if loaded:
+            raise ImproperlyConfigured(
+                'Serializing %s read the unselected column(s) %s; declare '
+                'them in the columns option of the serializer' % (
+                    self.get_resource_type(), ', '.join(sorted(loaded))))
+
+    def get_missing_pks(self, resources, pks, pk_field):
+        """Returns the ``pks`` none of the ``resources`` has."""
+        found = set('%s' % (r[pk_field] if isinstance(r, dict) else
+                            getattr(r, pk_field)) for r in resources)
+        return [pk for pk in pks if pk not in found]
+
+    def paginate_resources(self, qs):
+        """
+        Limits a collection to the requested page.
+
+        Does nothing unless ``pagination_class`` is set. The page is stored
+        on the context and adds the ``meta`` and ``links.next`` members to
+        the document.
+
+        """
+        paginator = self.get_paginator()
+        if paginator is None:
+            return qs
+        self.context.page = paginator.paginate(qs, self.request)
+        return self.context.page.items
+
+    def get_paginator(self):
+        """
+        Creates the paginator for collection requests.
+
+        Defaults to an instance of ``pagination_class`` ordering on the
+        ``pk_field``.
+
+        """
+        if not self.pagination_class:
+            return None
+        return self.pagination_class(ordering=self.get_pk_field())
 
     def get_filtered_queryset(self):
-        qs = self.get_queryset()
-        if self.filter_class:
-            return self.filter_class(self.request.GET, queryset=qs).qs
+        """
+        Applies the ``filter_class`` to the queryset.
+
+        The filtered queryset is built once per request and cloned on
+        every call.
+
+        """
+        qs = self.context.filtered_queryset if self.context else None
+        if qs is None:
+            qs = self.get_queryset()
+            if self.filter_class:
+                qs = self.filter_class(self.request.GET, queryset=qs).qs
+            if self.context:
+                self.context.filtered_queryset = qs
+        if hasattr(qs, '_clone'):
+            return qs._clone()
         return qs
 
     def is_changed_besides(self, resource, model):
@@ -292,11 +738,30 @@ class GetEndpoint(View):
         pks = pks.split(',') if pks else []
         fields = request.GET.get('fields')
         fields = None if not fields else fields.split(',')
-        resource_descriptor = RequestContext.create_resource_descriptor(self.resource_name, pks, fields=fields)
+        include = self.get_include(request)
+        resource_descriptor = RequestContext.create_resource_descriptor(self.resource_name, pks, fields=fields, include=include)
         context = RequestContext(request, resource_descriptor)
         context.update_mode('GET')
         return context
 
+    def get_include(self, request):
+        """
+        Parses the ``include`` query parameter into a list of relation
+        paths, e.g. ``include=comments,comments.author``.
+
+        Returns ``None`` when the parameter is missing, in which case all
+        relations of the resource are included. An empty ``include``
+        excludes all of them. Raises ``InvalidInclude`` for unknown
+        relations.
+
+        """
+        if 'include' not in request.GET:
+            return None
+        include = [p for p in request.GET.get('include').split(',') if p]
+        if include:
+            parse_include(self.get_resource_type(), include)
+        return include
+
     def extract_resources(self, request):
         """
         Extracts resources from the request body.
@@ -328,8 +793,22 @@ class GetEndpoint(View):
         return json.loads(data)
 
     def create_json(self, data, *args, **kwargs):
+        if self.json_backend:
+            kwargs.setdefault('backend', self.json_backend)
         return json.dumps(data, *args, **kwargs)
 
+    def get_json_indent(self):
+        """
+        Determines the indentation of JSON responses.
+
+        Responses are compact unless ``pretty_print`` is set on the class
+        or the client passes the ``pretty`` query parameter.
+
+        """
+        if self.pretty_print or 'pretty' in self.request.GET:
+            return 2
+        return None
+
     def get_methods(self):
         return self.methods
 
@@ -356,6 +835,7 @@ class GetLinkedEndpoint(GetEndpoint):
 
     def get(self, request, *args, **kwargs):
         self.context = self.create_get_context(request)
+        self.start_etag()
         collection = False
         # We're dealing with a request for a related resource
         if self.context.requested_single_related_resource or not self.context.to_many:
@@ -366,7 +846,9 @@ class GetLinkedEndpoint(GetEndpoint):
             # Multiple relationship ids or a to-many relationship
             data = self.get_related_resources()
             collection = True
-        return self.create_http_response(data, collection=collection)
+        # Related resources only come with linked ones when asked for
+        compound = self.context.resource_descriptor.include is not None
+        return self.create_http_response(data, collection=collection, compound=compound)
 
     def get_related_resource(self):
         """
@@ -392,18 +874,24 @@ class GetLinkedEndpoint(GetEndpoint):
         instances were requested or no ids were supplied.
 
         """
-        qs = self.get_related_queryset().all()
-        if self.context.relationship_pks:
+        qs = self.load_links(self.get_related_queryset().all())
+        rel_pks = self.context.relationship_pks
+        if rel_pks:
             pk_field = self.get_relationship_pk_field()
-            filter = {'%s__in' % pk_field: self.context.relationship_pks}
+            filter = {'%s__in' % pk_field: rel_pks}
             qs = qs.filter(**filter)
-        if not qs.exists():
+        resources = list(qs)
+        if not resources:
             raise Http404()
-        return qs
+        if rel_pks:
+            self.context.missing_pks = self.get_missing_pks(resources, rel_pks, pk_field)
+        return resources
 
     def get_related_queryset(self):
         field_name = self.get_related_field_name()
         resource = self.get_resource()
+        # The ETag must not be newer than the related resources
+        self.generate_etag()
         return getattr(resource, field_name)
 
     def get_resource_type(self):
@@ -418,7 +906,8 @@ class GetLinkedEndpoint(GetEndpoint):
         rel_pks = rel_pks.split(',') if rel_pks else []
         many = self.is_to_many_relationship()
         rel_descriptor = RequestContext.create_relationship_descriptor(self.relationship_name, rel_pks, many)
-        resource_descriptor = RequestContext.create_resource_descriptor(self.resource_name, pks, rel_descriptor)
+        include = self.get_include(request)
+        resource_descriptor = RequestContext.create_resource_descriptor(self.resource_name, pks, rel_descriptor, include=include)
         context = RequestContext(request, resource_descriptor)
         context.update_mode('GET')
         return context
@@ -464,6 +953,8 @@ class WithFormMixin(object):
     """
 
     form_class = None
+    #: Number of rows per query when creating or updating in bulk
+    bulk_batch_size = 500
 
     def get_form_kwargs(self, **kwargs):
         return kwargs
@@ -477,9 +968,9 @@ class WithFormMixin(object):
     def form_invalid(self, form):
         raise FormValidationError('', form=form)
 
-    def get_form(self, resource, instance=None):
+    def get_form(self, resource, instance=None, original=None):
         """Constructs a new form instance with the supplied data."""
-        data = self.prepare_form_data(resource, instance)
+        data = self.prepare_form_data(resource, instance, original)
         form_kwargs = {'data': data, 'instance': instance}
         form_kwargs = self.get_form_kwargs(**form_kwargs)
         form_class = self.get_form_class()
@@ -487,14 +978,17 @@ class WithFormMixin(object):
             raise ImproperlyConfigured('Missing form_class')
         return form_class(**form_kwargs)
 
-    def prepare_form_data(self, resource, instance=None):
-        """Last chance to tweak the data being passed to the form."""
+    def prepare_form_data(self, resource, instance=None, original=None):
+        """
+        Last chance to tweak the data being passed to the form.
+
+        Updates merge ``resource`` into the serialized ``instance``. Pass
+        that as ``original`` when it's already known.
+
+        """
         if instance:
-            # The instance is converted to JSON and then loaded to ensure
-            # special encodings (like timezone-conversion) are performed
-            as_json = self.create_json(self.serialize(instance, compound=False))
-            original = json.loads(as_json)
-            original = original[self.resource_name]
+            if original is None:
+                original = self.get_original(instance)
             merged = dict(original.items() + original.get('links', {}).items())
             data = dict(resource.items() + resource.get('links', {}).items())
             for field, value in data.items():
@@ -505,6 +999,18 @@ class WithFormMixin(object):
             return merged
         return dict(resource.items() + resource.get('links', {}).items())
 
+    def get_original(self, instance, many=False):
+        """
+        Serializes ``instance`` (or a list of instances) the way a GET
+        would return it.
+
+        The values are normalized to what decoding the JSON gives to ensure
+        special encodings (like timezone-conversion) are performed.
+
+        """
+        data = self.serialize(instance, collection=many, compound=False)
+        return json.normalize(data[self.resource_name])
+
 
 class PostMixin(object):
     """
@@ -527,6 +1033,7 @@ class PostMixin(object):
             collection = True
         else:
             data = self.create_resource(payload.resource)
+        self.invalidate_cached_responses()
         return self.create_http_response(data, collection=collection)
 
     def create_post_context(self, request):
@@ -564,14 +1071,70 @@ class PostWithFormMixin(PostMixin, WithFormMixin):
     """
     Provides an implementation of ``create_resource`` using a form.
 
+    Set ``bulk_create`` to create multiple resources at once: all forms
+    are validated first (every error ends up in a single 400 response),
+    then the instances are inserted in order with ``bulk_create`` in
+    batches of ``bulk_batch_size`` and their many to many relations with
+    one insert per relation. Since ``form_valid`` isn't called and no
+    ``post_save`` or ``m2m_changed`` signals are sent, this requires model
+    forms without any custom saving logic.
+
+    The instances need their primary keys for the relations and the
+    response, so the bulk insert only happens on PostgreSQL and SQLite
+    (or when the forms set the keys); other databases like MySQL insert
+    them one by one with a ``RuntimeWarning`` (see
+    ``compat.bulk_insert``).
+
     """
 
+    bulk_create = False
+    bulk_batch_size = 500
+
     def create_resource(self, resource):
         form = self.get_form(resource)
         if form.is_valid():
             return self.form_valid(form)
         return self.form_invalid(form)
 
+    def create_resources(self, resources):
+        if not self.bulk_create:
+            return super(PostWithFormMixin, self).create_resources(resources)
+        forms = [self.get_form(r) for r in resources]
+        invalid = [(i, form) for i, form in enumerate(forms) if not form.is_valid()]
+        if invalid:
+            raise FormValidationError('', forms=invalid)
+        return self.bulk_create_forms(forms)
+
+    def bulk_create_forms(self, forms):
+        """Saves the instances of valid model forms in bulk."""
+        if not forms:
+            return []
+        # Validating a model form already populated its instance
+        instances = [form.instance for form in forms]
+        model = instances[0].__class__
+        compat.bulk_insert(model, instances, batch_size=self.bulk_batch_size)
+        self.bulk_save_m2m(model, forms)
+        return instances
+
+    def bulk_save_m2m(self, model, forms):
+        for field in model._meta.many_to_many:
+            if not all(field.name in form.cleaned_data for form in forms):
+                continue
+            through = compat.get_remote_field(field).through
+            if not through._meta.auto_created:
+                # Let the field deal with custom intermediary models
+                for form in forms:
+                    field.save_form_data(form.instance, form.cleaned_data[field.name])
+                continue
+            source = through._meta.get_field(field.m2m_field_name()).attname
+            target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+            rows = []
+            for form in forms:
+                for related in form.cleaned_data[field.name] or []:
+                    rows.append(through(**{source: form.instance.pk,
+                                           target: related.pk}))
+            through._default_manager.bulk_create(rows, batch_size=self.bulk_batch_size)
+
 
 class PutMixin(object):
     """
@@ -596,6 +1159,7 @@ class PutMixin(object):
             collection = True
         else:
             changed_more, data = self.update_resource(payload.resource)
+        self.invalidate_cached_responses()
         if not changed_more:
             # > A server MUST return a 204 No Content status code if an update
             # > is successful and the client's current attributes remain up to
@@ -631,8 +1195,93 @@ class PutWithFormMixin(PutMixin, WithFormMixin):
     """
     Provides an implementation of ``update_resource`` using a form.
 
+    Set ``bulk_update`` to update multiple resources at once: the instances
+    are loaded with a single query and serialized together, all forms are
+    validated first (every error ends up in a single 400 response), then
+    the modified columns are written with one query per batch of
+    ``bulk_batch_size``. Since ``form_valid`` isn't called and no
+    ``post_save`` signals are sent, this requires model forms without any
+    custom saving logic. Fields with ``auto_now`` are updated on every
+    instance, like saving them would.
+
     """
 
+    bulk_update = False
+
+    def update_resources(self, resources):
+        if not self.bulk_update:
+            return super(PutWithFormMixin, self).update_resources(resources)
+        for resource in resources:
+            if resource['id'] not in self.context.pks:
+                message = 'Id %s in request body but not in URL' % resource['id']
+                raise IdMismatch(message)
+        pk_field = self.get_pk_field()
+        ids = [resource['id'] for resource in resources]
+        filter = {'%s__in' % pk_field: ids}
+        instances = dict(('%s' % getattr(i, pk_field), i)
+                         for i in self.get_queryset().filter(**filter))
+        missing = [pk for pk in ids if pk not in instances]
+        if missing:
+            raise Http404('Resources %s not found' % ','.join(missing))
+        instances = [instances[pk] for pk in ids]
+        originals = self.get_original(instances, many=True)
+        forms = []
+        invalid = []
+        for index, resource in enumerate(resources):
+            instance = instances[index]
+            # Validating the form updates the instance, keep the values to
+            # find the modified columns
+            values = self.get_column_values(instance)
+            form = self.get_form(resource, instance, originals[index])
+            if form.is_valid():
+                forms.append((form, values))
+            else:
+                invalid.append((index, form))
+        if invalid:
+            raise FormValidationError('', forms=invalid)
+        self.bulk_update_forms(forms)
+        changed = [self.is_changed_besides(r, i) for r, i in zip(resources, instances)]
+        return any(changed), instances
+
+    def get_column_values(self, instance):
+        return dict((f.attname, getattr(instance, f.attname))
+                    for f in instance._meta.concrete_fields)
+
+    def bulk_update_forms(self, forms):
+        """
+        Saves the instances of valid model forms, given with their column
+        values from before validation, in bulk.
+
+        """
+        if not forms:
+            return
+        changed_instances = []
+        changed_fields = set()
+        for form, values in forms:
+            columns = set(name for name, value in self.get_column_values(form.instance).items()
+                          if values[name] != value)
+            if columns:
+                changed_instances.append(form.instance)
+                changed_fields |= columns
+        model = forms[0][0].instance.__class__
+        auto_now = [f for f in model._meta.concrete_fields
+                    if getattr(f, 'auto_now', False)]
+        if auto_now:
+            # Model.save() bumps these through pre_save on every save
+            for form, values in forms:
+                for field in auto_now:
+                    field.pre_save(form.instance, False)
+            changed_instances = [form.instance for form, values in forms]
+            changed_fields |= set(f.attname for f in auto_now)
+        fields = [f.name for f in model._meta.concrete_fields
+                  if f.attname in changed_fields and not f.primary_key]
+        compat.bulk_update(model, changed_instances, fields,
+                           batch_size=self.bulk_batch_size)
+        for form, values in forms:
+            for field in model._meta.many_to_many:
+                if field.name in form.changed_data and field.name in form.cleaned_data:
+                    field.save_form_data(form.instance, form.cleaned_data[field.name])
+
     def update_resource(self, resource):
         resource_id = resource['id']
         if resource_id not in self.context.pks:
@@ -651,8 +1300,17 @@ class DeleteMixin(object):
     """
     Provides support for DELETE request on single + multiple resources.
 
+    By default every resource is fetched and deleted separately so any
+    logic in the ``delete`` method of the model runs. Set ``bulk_delete``
+    to delete with a queryset instead, in batches of ``delete_batch_size``
+    pks: Django's collector still handles cascades and signals, and
+    deletes with a single query when there are none.
+
     """
 
+    bulk_delete = False
+    delete_batch_size = 500
+
     def get_methods(self):
         return super(DeleteMixin, self).get_methods() + ['delete']
 
@@ -667,6 +1325,7 @@ class DeleteMixin(object):
             not_deleted = self.delete_resource()
         else:
             not_deleted = self.delete_resources()
+        self.invalidate_cached_responses()
         if not_deleted:
             raise Http404('Resources %s not found' % ','.join(not_deleted))
         return HttpResponse(status=204)
@@ -686,14 +1345,29 @@ class DeleteMixin(object):
         return self.perform_delete(self.context.pks)
 
     def perform_delete(self, pks):
-        not_deleted = pks[:]
+        if self.bulk_delete:
+            return self.perform_bulk_delete(pks)
+        deleted = set()
         filter = {'%s__in' % self.get_pk_field(): pks}
         for item in self.get_queryset().filter(**filter).iterator():
             # Fetch each item separately to actually trigger any logic
             # performed in the delete method (like implicit deletes)
-            not_deleted.remove('%s' % item.pk)
+            deleted.add('%s' % item.pk)
             item.delete()
-        return not_deleted
+        return [pk for pk in pks if pk not in deleted]
+
+    def perform_bulk_delete(self, pks):
+        pk_field = self.get_pk_field()
+        found = set()
+        size = self.delete_batch_size
+        for start in range(0, len(pks), size):
+            filter = {'%s__in' % pk_field: pks[start:start + size]}
+            queryset = self.get_queryset().filter(**filter)
+            existing = set('%s' % pk for pk in queryset.values_list(pk_field, flat=True))
+            if existing:
+                queryset.delete()
+                found |= existing
+        return [pk for pk in pks if pk not in found]
 
 
 class Endpoint(PostWithFormMixin, PutWithFormMixin, DeleteMixin, GetEndpoint):
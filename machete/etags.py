@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from __future__ import (unicode_literals, print_function, division,
+                        absolute_import)
+
+import hashlib
+
+from django.db.models import Count, Max
+
+
+class ETagStrategy(object):
+    """
+    Computes the ETag of the (filtered) queryset of a request.
+
+    Set an instance as ``etag_strategy`` on an endpoint.
+
+    """
+
+    def generate(self, queryset):
+        raise NotImplementedError()
+
+    def hash(self, values):
+        value = ','.join('%s' % v for v in values)
+        return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+class AttributeETag(ETagStrategy):
+    """
+    Hashes the value of ``attribute`` for every object in Python.
+
+    This is what ``etag_attribute`` does. It's exact but transfers a value
+    per row; prefer an ``AggregateETag`` for large collections.
+
+    """
+
+    def __init__(self, attribute):
+        self.attribute = attribute
+
+    def generate(self, queryset):
+        values = queryset.values_list(self.attribute, flat=True)
+        return self.hash(values)
+
+
+class AggregateETag(ETagStrategy):
+    """
+    Computes the ETag from aggregates calculated by the database.
+
+    Takes the same arguments as ``QuerySet.aggregate``, for instance
+    ``AggregateETag(Max('updated_at'), Count('pk'))``. Database specific
+    aggregates (like a hash of pks and versions) can be passed as well. The
+    request costs a single small query, no matter the size of the
+    collection.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+    def generate(self, queryset):
+        # Clear the ordering, it's irrelevant for the aggregates
+        aggregates = queryset.order_by().aggregate(*self.args, **self.kwargs)
+        return self.hash(aggregates[key] for key in sorted(aggregates))
+
+
+class LatestChangeETag(AggregateETag):
+    """
+    Combines the latest value of a timestamp or version ``field`` with the
+    number of objects (so deletes change the ETag as well).
+
+    """
+
+    def __init__(self, field):
+        super(LatestChangeETag, self).__init__(latest=Max(field), count=Count('pk'))
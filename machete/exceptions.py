@@ -21,8 +21,22 @@ class IdMismatch(JsonApiError):
     pass
 
 
+class InvalidPage(JsonApiError):
+    pass
+
+
+class InvalidInclude(JsonApiError):
+    pass
+
+
 class FormValidationError(JsonApiError):
+    """
+    Raised for an invalid ``form`` or, when validating multiple resources at
+    once, for the invalid ``forms`` given as ``(index, form)`` pairs.
+
+    """
 
     def __init__(self, *args, **kwargs):
         self.form = kwargs.pop('form', None)
+        self.forms = kwargs.pop('forms', None)
         super(FormValidationError, self).__init__(*args, **kwargs)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+A request scoped identity map.
+
+Every model instance loaded while building a document (the primary data,
+related resources and linked resources) is registered in the active
+``IdentityMap``, so a later load of the same object can reuse it instead of
+querying again (see ``use_caching`` on ``RelationIdField``).
+
+The active map lives in a context variable when ``contextvars`` is
+available, which keeps requests handled concurrently by async views or
+greenlets apart. Older Pythons fall back to a thread local.
+
+"""
+from __future__ import (unicode_literals, print_function, division,
+                        absolute_import)
+
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from . import compat
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+
+__all__ = ['IdentityMap', 'identity_map', 'get_identity_map',
+           'use_identity_map']
+
+#: Default maximum number of instances held by a map
+DEFAULT_MAX_SIZE = 10000
+
+
+class IdentityMap(object):
+    """
+    Maps ``(model, field, value)`` to the instance loaded for it, ``field``
+    being the unique field the value was looked up by (``pk`` by default).
+
+    At most ``max_size`` instances are held (the ``MACHETE_IDENTITY_MAP_SIZE``
+    setting by default); instances loaded after that simply aren't
+    registered. Instances with deferred fields aren't registered either,
+    since reusing them would load the missing fields one object at a time.
+
+    """
+
+    def __init__(self, max_size=None):
+        if max_size is None:
+            max_size = getattr(settings, 'MACHETE_IDENTITY_MAP_SIZE',
+                               DEFAULT_MAX_SIZE)
+        self.max_size = max_size
+        self.instances = {}
+        self.parent = None
+
+    def __len__(self):
+        return len(self.instances)
+
+    def get_key(self, model, field, value):
+        opts = model._meta
+        if field == 'pk':
+            field = opts.pk.name
+        return (opts.concrete_model, field, '%s' % value)
+
+    def get(self, model, value, field='pk'):
+        key = self.get_key(model, field, value)
+        instance = self.instances.get(key)
+        if instance is None and self.parent is not None:
+            instance = self.parent.instances.get(key)
+        return instance
+
+    def get_many(self, model, values, field='pk'):
+        """Returns the instances held for ``values`` keyed by value."""
+        found = {}
+        for value in values:
+            instance = self.get(model, value, field)
+            if instance is not None:
+                found['%s' % value] = instance
+        return found
+
+    def add_many(self, instances, field='pk'):
+        """
+        Registers model ``instances`` (of the same query) by the value of
+        their ``field``.
+
+        """
+        instances = list(instances)
+        if not instances:
+            return
+        opts = getattr(instances[0], '_meta', None)
+        if opts is None or compat.get_deferred_fields(instances[0]):
+            return
+        for instance in instances:
+            if len(self.instances) >= self.max_size:
+                return
+            value = getattr(instance, field)
+            self.instances[self.get_key(opts.model, field, value)] = instance
+
+    def fork(self):
+        """
+        Returns a map for work another thread does on behalf of the owner
+        of this one. It reads the instances of this map but registers new
+        ones on its own, so this map is only ever written by its owner,
+        who adds them with ``merge`` once the work is done.
+
+        """
+        child = IdentityMap(self.max_size)
+        child.parent = self
+        return child
+
+    def merge(self, other):
+        """Registers the instances of ``other`` not held yet."""
+        for key, instance in other.instances.items():
+            if len(self.instances) >= self.max_size:
+                return
+            self.instances.setdefault(key, instance)
+
+
+if contextvars is not None:
+    _current = contextvars.ContextVar('machete_identity_map', default=None)
+
+    def get_identity_map():
+        """Returns the active ``IdentityMap`` or ``None``."""
+        return _current.get()
+
+    def _activate(identity_map):
+        return _current.set(identity_map)
+
+    def _deactivate(token):
+        _current.reset(token)
+else:
+    _local = threading.local()
+
+    def get_identity_map():
+        """Returns the active ``IdentityMap`` or ``None``."""
+        return getattr(_local, 'identity_map', None)
+
+    def _activate(identity_map):
+        previous = get_identity_map()
+        _local.identity_map = identity_map
+        return previous
+
+    def _deactivate(previous):
+        _local.identity_map = previous
+
+
+@contextmanager
+def identity_map(max_size=None):
+    """
+    Activates a new ``IdentityMap`` for the enclosed code and yields it.
+
+    When a map is active already that one is yielded instead, so nested
+    scopes (like serializing within a request) share their instances.
+
+    """
+    active = get_identity_map()
+    if active is not None:
+        yield active
+        return
+    active = IdentityMap(max_size)
+    token = _activate(active)
+    try:
+        yield active
+    finally:
+        _deactivate(token)
+
+
+@contextmanager
+def use_identity_map(active):
+    """
+    Activates the existing map ``active`` for the enclosed code, e.g. in a
+    thread working for the request that created it. Does nothing for
+    ``None``.
+
+    """
+    if active is None:
+        yield active
+        return
+    token = _activate(active)
+    try:
+        yield active
+    finally:
+        _deactivate(token)
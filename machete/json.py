@@ -1,4 +1,19 @@
 # -*- coding: utf-8 -*-
+"""
+JSON encoding and decoding.
+
+Encoding goes through a backend: the standard library (``stdlib``, the
+default) or `simplejson`_ (``simplejson``, using its C speedups) when it's
+installed. Both share the same semantics for dates, times and decimals.
+Pick one with the ``MACHETE_JSON_BACKEND`` setting, per endpoint with
+``json_backend`` or per call with the ``backend`` argument of ``dumps``.
+``run_benchmarks.py json_backends`` compares them on your platform.
+
+Output is compact unless an ``indent`` is passed.
+
+.. _`simplejson`: https://pypi.python.org/pypi/simplejson
+
+"""
 from __future__ import (unicode_literals, print_function, division,
                         absolute_import)
 
@@ -6,25 +21,136 @@ import json
 import decimal
 import datetime
 
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.utils import timezone
 
 
-__all__ = ['StandardizedJSONEncoder', 'loads', 'dumps']
+__all__ = ['StandardizedJSONEncoder', 'loads', 'dumps', 'normalize',
+           'get_backend', 'register_backend']
+
+COMPACT_SEPARATORS = (',', ':')
+INDENT_SEPARATORS = (',', ': ')
+
+
+def encode_default(o):
+    """
+    Converts the values the encoders don't support natively. Raises a
+    ``TypeError`` for anything else.
+
+    """
+    if isinstance(o, datetime.datetime):
+        if timezone.is_naive(o):
+            o = timezone.make_aware(o, timezone.get_default_timezone())
+        o = o.astimezone(timezone.utc)
+        return o.strftime('%Y-%m-%dT%H:%M:%SZ')
+    if isinstance(o, (datetime.date, datetime.time)):
+        return o.isoformat()
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    raise TypeError(repr(o) + ' is not JSON serializable')
 
 
 class StandardizedJSONEncoder(json.JSONEncoder):
 
     def default(self, o):
-        if isinstance(o, datetime.datetime):
-            if timezone.is_naive(o):
-                o = timezone.make_aware(o, timezone.get_default_timezone())
-            o = o.astimezone(timezone.utc)
-            return o.strftime('%Y-%m-%dT%H:%M:%SZ')
-        if isinstance(o, (datetime.date, datetime.time)):
-            return o.isoformat()
-        if isinstance(o, decimal.Decimal):
-            return str(o)
-        return super(StandardizedJSONEncoder, self).default(o)
+        try:
+            return encode_default(o)
+        except TypeError:
+            return super(StandardizedJSONEncoder, self).default(o)
+
+
+class Backend(object):
+    """Encodes data to JSON using a specific library."""
+
+    name = None
+
+    def is_available(self):
+        return True
+
+    def dumps(self, data, **kwargs):
+        raise NotImplementedError()
+
+    def prepare_kwargs(self, kwargs):
+        if 'separators' not in kwargs:
+            indented = kwargs.get('indent') is not None
+            kwargs['separators'] = INDENT_SEPARATORS if indented else COMPACT_SEPARATORS
+        return kwargs
+
+
+class StdlibBackend(Backend):
+    name = 'stdlib'
+
+    def dumps(self, data, **kwargs):
+        kwargs = self.prepare_kwargs(kwargs)
+        if 'cls' not in kwargs:
+            kwargs['cls'] = StandardizedJSONEncoder
+        return json.dumps(data, **kwargs)
+
+
+class SimplejsonBackend(Backend):
+    name = 'simplejson'
+
+    def is_available(self):
+        try:
+            import simplejson
+        except ImportError:
+            return False
+        return True
+
+    def dumps(self, data, **kwargs):
+        import simplejson
+        kwargs = self.prepare_kwargs(kwargs)
+        kwargs.pop('cls', None)
+        kwargs.setdefault('default', encode_default)
+        # Let encode_default turn decimals into strings like the stdlib
+        # backend does
+        kwargs.setdefault('use_decimal', False)
+        # Encode (named)tuples as arrays and ignore for_json() like the
+        # stdlib does
+        kwargs.setdefault('namedtuple_as_object', False)
+        kwargs.setdefault('tuple_as_array', True)
+        kwargs.setdefault('for_json', False)
+        return simplejson.dumps(data, **kwargs)
+
+
+_backends = {}
+
+
+def register_backend(backend):
+    """Makes a backend available by its name."""
+    _backends[backend.name] = backend
+
+
+register_backend(StdlibBackend())
+register_backend(SimplejsonBackend())
+
+
+def get_backend(name=None):
+    if name is None:
+        name = getattr(settings, 'MACHETE_JSON_BACKEND', 'stdlib')
+    try:
+        backend = _backends[name]
+    except KeyError:
+        raise ImproperlyConfigured('Unknown JSON backend %s' % name)
+    if not backend.is_available():
+        raise ImproperlyConfigured('JSON backend %s is not installed' % name)
+    return backend
+
+
+def normalize(data):
+    """
+    Returns what decoding the JSON of ``data`` would give, without encoding
+    it: dates, times and decimals are converted like ``dumps`` does.
+
+    """
+    if isinstance(data, dict):
+        return dict(('%s' % k, normalize(v)) for k, v in data.items())
+    if isinstance(data, (list, tuple)):
+        return [normalize(v) for v in data]
+    if data is None or isinstance(data, (bool, int, long, float, basestring)):
+        return data
+    return encode_default(data)
 
 
 def loads(o, **kwargs):
@@ -32,6 +158,5 @@ def loads(o, **kwargs):
 
 
 def dumps(data, **kwargs):
-    if 'cls' not in kwargs:
-        kwargs['cls'] = StandardizedJSONEncoder
-    return json.dumps(data, **kwargs)
+    backend = get_backend(kwargs.pop('backend', None))
+    return backend.dumps(data, **kwargs)
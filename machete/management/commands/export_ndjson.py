@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Exports all resources of a registered serializer as newline delimited JSON,
+one resource per line.
+
+The table is split in ranges of ``--chunk-size`` primary keys, found with
+one keyset query per range on the primary key index, so the primary keys
+are never loaded all at once. Each range is a plain range condition on
+the primary key, fetched and marshalled on its own, so memory stays bounded
+by the chunk size and ranges can be exported by ``--processes`` worker
+processes. Lines are written in primary key order either way.
+
+Links are loaded like in the API (``select_related``/``prefetch_related``
+for the link fields, batched queries per chunk otherwise) and every line is
+encoded like the API encodes the resource, so it matches the resource in
+the ``data`` of a response byte for byte. URLs are relative unless
+``--base-url`` is passed.
+
+"""
+from __future__ import (unicode_literals, print_function, division,
+                        absolute_import)
+
+import gzip
+import urlparse
+import multiprocessing
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.test.client import RequestFactory
+
+from ... import json
+from ...identity import identity_map
+from ...serializers import registry, load_related
+from ...vendor.marshmallow.exceptions import RegistryError
+
+
+def get_pk_ranges(queryset, size):
+    """
+    Returns ``(lower, upper)`` pairs covering all primary keys of
+    ``queryset`` with at most ``size`` rows each. ``lower`` is exclusive,
+    ``upper`` inclusive, ``None`` leaves that end open.
+
+    """
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    ranges = []
+    lower = None
+    while True:
+        qs = pks if lower is None else pks.filter(pk__gt=lower)
+        upper = list(qs[size - 1:size])
+        if not upper:
+            ranges.append((lower, None))
+            return ranges
+        ranges.append((lower, upper[0]))
+        lower = upper[0]
+
+
+def create_request(base_url):
+    """Returns a request for absolute URLs below ``base_url``."""
+    parts = urlparse.urlsplit(base_url)
+    request = RequestFactory().get('/', secure=parts.scheme == 'https',
+                                   HTTP_HOST=parts.netloc)
+    request._machete_url_base = '%s://%s' % (parts.scheme, parts.netloc)
+    return request
+
+
+def export_range(job):
+    """
+    Marshals the resources of a primary key range and returns their lines,
+    encoded as UTF-8. Runs in the worker processes, hence the single tuple
+    argument ``(name, model label, database, lower, upper, base URL, JSON
+    backend)``.
+
+    """
+    name, model_label, using, lower, upper, base_url, backend = job
+    serializer_class = registry.get_class(name)
+    queryset = apps.get_model(model_label)._default_manager.using(using)
+    if lower is not None:
+        queryset = queryset.filter(pk__gt=lower)
+    if upper is not None:
+        queryset = queryset.filter(pk__lte=upper)
+    queryset = load_related(queryset.order_by('pk'), serializer_class())
+    context = {}
+    if base_url:
+        context['request'] = create_request(base_url)
+    with identity_map():
+        data = serializer_class(list(queryset), many=True,
+                                context=context).data
+    lines = [json.dumps(item, backend=backend) + '\n' for item in data]
+    return ''.join(lines).encode('utf-8')
+
+
+class Command(BaseCommand):
+    help = ('Exports all resources of a registered serializer as newline '
+            'delimited JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('name',
+            help='Resource type the serializer is registered for')
+        parser.add_argument('--model',
+            help='Model to export as app_label.ModelName, required when the '
+                 'serializer has no Meta.model')
+        parser.add_argument('-o', '--output', default='-',
+            help='File to write to, stdout by default')
+        parser.add_argument('--gzip', action='store_true', default=False,
+            help='Compress the output with gzip')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+            help='Number of resources marshalled at a time (default 1000)')
+        parser.add_argument('--processes', type=int, default=1,
+            help='Number of worker processes exporting chunks (default 1)')
+        parser.add_argument('--base-url', default='',
+            help='Scheme and host for absolute URLs, e.g. '
+                 'https://api.example.com')
+        parser.add_argument('--json-backend', default=None,
+            help='JSON backend, the MACHETE_JSON_BACKEND setting by default')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+            help='Database to export from')
+
+    def handle(self, *args, **options):
+        name = options['name']
+        try:
+            serializer_class = registry.get_class(name)
+        except RegistryError:
+            raise CommandError('No serializer registered for "%s"' % name)
+        model = self.get_model(serializer_class, options['model'])
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        if options['processes'] < 1:
+            raise CommandError('--processes must be at least 1')
+        json.get_backend(options['json_backend'])
+        using = options['database']
+        ranges = get_pk_ranges(model._default_manager.using(using),
+                               options['chunk_size'])
+        model_label = '%s.%s' % (model._meta.app_label,
+                                 model._meta.object_name)
+        jobs = [(name, model_label, using, lower, upper, options['base_url'],
+                 options['json_backend']) for lower, upper in ranges]
+
+        path = options['output']
+        if path == '-':
+            # The stream wrapped by OutputWrapper, which would append line
+            # endings to every chunk
+            stream = getattr(self.stdout, '_out', self.stdout)
+        else:
+            stream = open(path, 'wb')
+        output = stream
+        if options['gzip']:
+            output = gzip.GzipFile(filename='', mode='wb', fileobj=stream)
+        count = 0
+        try:
+            for chunk in self.export(jobs, options['processes']):
+                output.write(chunk)
+                count += chunk.count(b'\n')
+        finally:
+            if output is not stream:
+                output.close()
+            if path == '-':
+                stream.flush()
+            else:
+                stream.close()
+        if options['verbosity'] > 0:
+            self.stderr.write('Exported %d %s' % (count, name))
+
+    def get_model(self, serializer_class, label):
+        if label:
+            try:
+                return apps.get_model(label)
+            except (LookupError, ValueError):
+                raise CommandError('Unknown model "%s"' % label)
+        model = getattr(serializer_class.get_opts(), 'model', None)
+        if model is None:
+            raise CommandError('The serializer has no Meta.model, pass '
+                               '--model')
+        return model
+
+    def export(self, jobs, processes):
+        """Yields the lines of each job, in the order of ``jobs``."""
+        if processes == 1 or len(jobs) < 2:
+            for job in jobs:
+                yield export_range(job)
+            return
+        # Forked workers must open their own connections
+        for connection in connections.all():
+            connection.close()
+        pool = multiprocessing.Pool(min(processes, len(jobs)))
+        try:
+            for chunk in pool.imap(export_range, jobs):
+                yield chunk
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
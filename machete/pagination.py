@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+from __future__ import (unicode_literals, print_function, division,
+                        absolute_import)
+
+from django.core.exceptions import ValidationError
+
+from .exceptions import InvalidPage
+
+
+class Page(object):
+    """
+    A single page of a collection.
+
+    ``meta`` ends up in the ``meta`` member of the document, ``next_params``
+    are the query parameters leading to the next page (``None`` when this
+    is the last page).
+
+    """
+
+    def __init__(self, items, meta, next_params=None):
+        self.items = items
+        self.meta = meta
+        self.next_params = next_params
+
+    @property
+    def has_next(self):
+        return self.next_params is not None
+
+    def get_next_url(self, request):
+        if not self.has_next:
+            return None
+        params = request.GET.copy()
+        for key, value in self.next_params.items():
+            params[key] = value
+        return request.build_absolute_uri('%s?%s' % (request.path, params.urlencode()))
+
+    def update_document(self, data, request):
+        """Adds the ``meta`` and ``links.next`` members to the document."""
+        data.setdefault('meta', {})['page'] = self.meta
+        next_url = self.get_next_url(request)
+        if next_url:
+            links = data.get('links')
+            if links is None:
+                links = data['links'] = {}
+            links['next'] = next_url
+        return data
+
+
+class BasePagination(object):
+    """
+    Splits a collection in pages based on the ``page[...]`` query parameters.
+
+    Requests without ``page[size]`` get ``default_size`` items, larger
+    sizes are capped at ``max_size``.
+
+    """
+
+    size_param = 'page[size]'
+    default_size = 20
+    max_size = 100
+
+    def __init__(self, ordering='pk', default_size=None, max_size=None):
+        self.ordering = ordering
+        if default_size is not None:
+            self.default_size = default_size
+        if max_size is not None:
+            self.max_size = max_size
+
+    def get_size(self, request):
+        size = request.GET.get(self.size_param)
+        if not size:
+            return self.default_size
+        try:
+            size = int(size)
+        except ValueError:
+            raise InvalidPage('Invalid value for %s' % self.size_param)
+        if size < 1:
+            raise InvalidPage('Invalid value for %s' % self.size_param)
+        return min(size, self.max_size)
+
+    def paginate(self, queryset, request):
+        raise NotImplementedError()
+
+    def fetch(self, queryset, size):
+        """
+        Fetches a page plus one item to know whether there's a next page
+        without counting the whole collection.
+
+        """
+        items = list(queryset[:size + 1])
+        return items[:size], len(items) > size
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor based pagination using ``page[size]`` and ``page[after]``.
+
+    The collection is ordered on ``ordering`` (a field name, prefix it with
+    ``-`` for descending order) and each page continues after the value of
+    that field on the last item of the previous page. Since that's a simple
+    range condition on an indexed column, deep pages cost as much as the
+    first one. The field must be unique (the primary key is used by
+    default).
+
+    """
+
+    after_param = 'page[after]'
+
+    def get_field_name(self):
+        return self.ordering.lstrip('-')
+
+    def is_descending(self):
+        return self.ordering.startswith('-')
+
+    def paginate(self, queryset, request):
+        size = self.get_size(request)
+        field_name = self.get_field_name()
+        queryset = queryset.order_by(self.ordering)
+        after = request.GET.get(self.after_param)
+        if after:
+            lookup = 'lt' if self.is_descending() else 'gt'
+            filter = {'%s__%s' % (field_name, lookup): after}
+            try:
+                queryset = queryset.filter(**filter)
+            except (ValueError, TypeError, ValidationError):
+                raise InvalidPage('Invalid value for %s' % self.after_param)
+        items, has_next = self.fetch(queryset, size)
+        meta = {'size': size}
+        if after:
+            meta['after'] = after
+        next_params = None
+        if has_next:
+            last = items[-1]
+            if isinstance(last, dict):
+                # Rows fetched with values()
+                cursor = '%s' % last[field_name]
+            else:
+                cursor = '%s' % getattr(last, field_name)
+            next_params = {self.size_param: size, self.after_param: cursor}
+        return Page(items, meta, next_params)
+
+
+class OffsetPagination(BasePagination):
+    """
+    Page number based pagination using ``page[size]`` and ``page[number]``.
+
+    Use this when the collection can't be ordered on a unique field; note
+    the database still has to skip all rows before the requested page.
+
+    """
+
+    number_param = 'page[number]'
+
+    def get_number(self, request):
+        number = request.GET.get(self.number_param)
+        if not number:
+            return 1
+        try:
+            number = int(number)
+        except ValueError:
+            raise InvalidPage('Invalid value for %s' % self.number_param)
+        if number < 1:
+            raise InvalidPage('Invalid value for %s' % self.number_param)
+        return number
+
+    def paginate(self, queryset, request):
+        size = self.get_size(request)
+        number = self.get_number(request)
+        if not queryset.ordered:
+            queryset = queryset.order_by(self.ordering)
+        offset = (number - 1) * size
+        items, has_next = self.fetch(queryset[offset:], size)
+        meta = {'size': size, 'number': number}
+        next_params = None
+        if has_next:
+            next_params = {self.size_param: size, self.number_param: number + 1}
+        return Page(items, meta, next_params)
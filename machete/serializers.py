@@ -4,20 +4,26 @@ from __future__ import (unicode_literals, print_function, division,
 
 import datetime
 import threading
-from collections import defaultdict, OrderedDict
+import time
+import urllib
+from collections import defaultdict, namedtuple, OrderedDict
 
 from .vendor.marshmallow import serializer, Serializer, fields, class_registry
-from django.db.models import ForeignKey, ManyToManyField
-from django.core.exceptions import ImproperlyConfigured
+from django.db.models import ForeignKey, ManyToManyField, Prefetch
+from django.core.exceptions import ImproperlyConfigured, FieldDoesNotExist
+from django.core.signals import setting_changed
+from django.core.urlresolvers import get_script_prefix, get_urlconf
+from django.utils.encoding import iri_to_uri
 from django.apps.registry import apps
 
 from . import compat
 from .urls import (get_resource_url_template, get_resource_detail_url,
-                   to_absolute_url, create_resource_view_name)
+                   to_absolute_url, create_resource_view_name, get_url_base)
 from .json import dumps
-
-
-threadlocal = threading.local()
+from .identity import identity_map, get_identity_map, use_identity_map
+from .exceptions import InvalidInclude
+from .vendor.marshmallow.exceptions import RegistryError
+from .utils import chunked
 
 
 class Registry(object):
@@ -44,34 +50,100 @@ class Registry(object):
 registry = Registry()
 
 
+PathInfo = namedtuple('PathInfo', ['serializer_class', 'relation_type',
+                                   'url_template'])
+
+
+class PathCache(object):
+    """
+    Process wide cache of resolved serializer paths.
+
+    Lookups are plain dict reads keyed per script prefix and URLconf; the
+    entries are dropped whenever a serializer gets registered or the
+    ``ROOT_URLCONF`` setting changes.
+
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._generation = class_registry.generation
+        self._lock = threading.Lock()
+
+    def get(self, key, resolve):
+        """
+        Returns the entry for ``key``, calling ``resolve`` to create it
+        when it's missing.
+
+        """
+        # URL templates depend on the script prefix and URLconf of the
+        # request, like in machete.urls.get_url_template
+        key = (key, get_script_prefix(), get_urlconf())
+        generation = class_registry.generation
+        if self._generation == generation:
+            value = self._entries.get(key)
+            if value is not None:
+                return value
+        value = resolve()
+        with self._lock:
+            if self._generation != generation:
+                self._entries = {}
+                self._generation = generation
+            self._entries[key] = value
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+
+path_cache = PathCache()
+
+
+def clear_path_cache(**kwargs):
+    if kwargs['setting'] == 'ROOT_URLCONF':
+        path_cache.clear()
+
+
+setting_changed.connect(clear_path_cache)
+
+
 def filter_fields(serializer, fields):
-    meta = serializer.Meta
-    if hasattr(meta, 'fields'):
-        allowed = set(getattr(meta, 'fields'))
+    opts = serializer.get_opts()
+    if hasattr(serializer.Meta, 'fields'):
+        allowed = set(opts.fields)
     else:
-        allowed = [n for n, mapping in serializer._declared_fields.items()]
-        if hasattr(meta, 'additional'):
-            allowed = allowed + list(getattr(meta, 'additional'))
-        allowed = set(allowed)
+        allowed = set(serializer._declared_fields) | set(opts.additional)
     return [f for f in fields if f in allowed]
 
 
 class JsonApiSerializer(object):
+    """
+    Builds JSON API documents.
+
+    Compound documents include the resources linked from the primary data
+    in ``linked``. Pass the relation paths to load as ``include`` (e.g.
+    ``['comments', 'comments.author']``); by default every relation of the
+    primary resource is loaded, one level deep.
+
+    """
 
-    def __init__(self, name, compound=False, self_link=False):
+    def __init__(self, name, compound=False, self_link=False, include=None,
+                 fragment_cache=None, executor=None):
         self.name = name
         self.compound = compound
         self.self_link = self_link
+        self.include = include
+        self.fragment_cache = fragment_cache
+        self.executor = executor
 
     def serialize(self, *args, **kwargs):
+        # Instances are shared through the identity map of the request or a
+        # new one for this document (see machete.identity)
         externalized_caching = kwargs.pop('externalized_caching', False)
         if externalized_caching:
             return self._do_serialize(*args, **kwargs)
-        setattr(threadlocal, 'cache', {})
-        try:
+        with identity_map():
             return self._do_serialize(*args, **kwargs)
-        finally:
-            delattr(threadlocal, 'cache')
 
     def _do_serialize(self, *args, **kwargs):
         serializer_class = kwargs.pop('serializer', None)
@@ -83,14 +155,143 @@ class JsonApiSerializer(object):
         if 'only' in kwargs:
             if kwargs['only']:
                 kwargs['only'] = filter_fields(serializer_class, kwargs['only'])
-        serializer = serializer_class(*args, **kwargs)
-        serialized_data = serializer.data
-        ids_by_type, ids_by_name = self.collect_ids(serialized_data, serializer)
+        if self.fragment_cache is not None and args and kwargs.get('many'):
+            data = list(args[0]) if args[0] is not None else []
+            serializer, serialized_data = self.marshal_fragments(
+                serializer_class, data, kwargs)
+            self.register_instances(data, True)
+        else:
+            serializer = serializer_class(*args, **kwargs)
+            serialized_data = serializer.data
+            self.register_instances(serializer.obj, serializer.many)
+        x, ids_by_name = self.collect_ids(serialized_data, serializer)
         require_links = ['%s.%s' % (self.name, k) for k in ids_by_name.keys()]
         linked_links = []
         linked = None
         if self.compound:
-            linked, linked_links = self.serialize_linked(serializer, ids_by_type)
+            linked, linked_links = self.serialize_linked(serializer, ids_by_name)
+        links = self.compile_document_links(require_links, linked_links,
+                                            serializer, context)
+        data = OrderedDict()
+        if links:
+            data['links'] = links
+        data[self.name] = serialized_data
+        if linked:
+            data['linked'] = linked
+        return data
+
+    def stream(self, data, encode, chunk_size=500, **kwargs):
+        """
+        Serializes a collection chunk by chunk, yielding the JSON document
+        in parts.
+
+        ``data`` is fetched in chunks (see ``machete.utils.chunked``) and
+        only ``chunk_size`` objects are marshalled at a time; ``encode``
+        turns a value into JSON. Since the top-level ``links`` and
+        ``linked`` members depend on all of the primary data, they follow
+        it in the document.
+
+        """
+        externalized_caching = kwargs.pop('externalized_caching', False)
+        if externalized_caching:
+            for part in self._do_stream(data, encode, chunk_size, **kwargs):
+                yield part
+            return
+        with identity_map():
+            for part in self._do_stream(data, encode, chunk_size, **kwargs):
+                yield part
+
+    def _do_stream(self, data, encode, chunk_size, **kwargs):
+        serializer_class = kwargs.pop('serializer', None)
+        if not serializer_class:
+            serializer_class = self.get_serializer_class(self.name)
+        if not 'context' in kwargs:
+            kwargs['context'] = {}
+        context = kwargs['context']
+        if kwargs.get('only'):
+            kwargs['only'] = filter_fields(serializer_class, kwargs['only'])
+        kwargs['many'] = True
+        ids_by_name = defaultdict(set)
+        serializer = None
+        yield '{%s: [' % encode(self.name)
+        for chunk in chunked(data, chunk_size):
+            separator = '' if serializer is None else ', '
+            if self.fragment_cache is not None:
+                serializer, serialized_data = self.marshal_fragments(
+                    serializer_class, chunk, kwargs)
+            else:
+                serializer = serializer_class(chunk, **kwargs)
+                serialized_data = serializer.data
+            # The chunks aren't registered in the identity map, that would
+            # keep them in memory; only their link ids are collected
+            x, by_name = self.collect_ids(serialized_data, serializer)
+            for name, ids in by_name.items():
+                ids_by_name[name] |= ids
+            yield separator + ', '.join(encode(i) for i in serialized_data)
+        yield ']'
+        if serializer is None:
+            serializer = serializer_class(None, **kwargs)
+        require_links = ['%s.%s' % (self.name, k) for k in ids_by_name.keys()]
+        linked_links = []
+        linked = None
+        if self.compound:
+            linked, linked_links = self.serialize_linked(serializer, ids_by_name)
+        links = self.compile_document_links(require_links, linked_links,
+                                            serializer, context)
+        if links:
+            yield ', "links": %s' % encode(links)
+        if linked:
+            yield ', "linked": %s' % encode(linked)
+        yield '}'
+
+    def marshal_fragments(self, serializer_class, objs, kwargs):
+        """
+        Marshals the list ``objs`` reusing the fragments the
+        ``fragment_cache`` holds for them; only the misses are passed to
+        a serializer, which is returned along with the marshalled data.
+
+        """
+        cache = self.fragment_cache
+        parts = self.get_fragment_key_parts(kwargs)
+        keys = [cache.make_key(self.name, obj, parts) for obj in objs]
+        found = cache.get_many(keys)
+        misses = [obj for obj, key in zip(objs, keys) if key not in found]
+        start = time.time()
+        serializer = serializer_class(misses, **kwargs)
+        marshalled = serializer.data
+        miss_keys = [key for key in keys if key not in found]
+        cache.set_many(dict(zip(miss_keys, marshalled)), time.time() - start)
+        marshalled = iter(marshalled)
+        serialized_data = [found[key] if key in found else next(marshalled)
+                           for key in keys]
+        return serializer, serialized_data
+
+    def get_fragment_key_parts(self, kwargs):
+        """
+        Returns what the fragments depend on besides the resource: the
+        requested fields and the absolute URL base.
+
+        """
+        only = kwargs.get('only')
+        fields = ','.join(sorted(only)) if only else '*'
+        request = kwargs['context'].get('request')
+        base = get_url_base(request) if request is not None else ''
+        return [fields, base]
+
+    def register_instances(self, data, many):
+        """Adds the serialized model instances to the identity map."""
+        active = get_identity_map()
+        if active is None or data is None:
+            return
+        if not many:
+            data = [data]
+        elif getattr(data, '_result_cache', data) is None:
+            # An unevaluated queryset, don't query again
+            return
+        active.add_many(data)
+
+    def compile_document_links(self, require_links, linked_links, serializer,
+                               context):
         links = self.compile_links(require_links, context)
         linked_links = self.compile_links(linked_links, context, self.name + '.')
         links = dict(linked_links.items() + links.items())
@@ -99,30 +300,46 @@ class JsonApiSerializer(object):
                 'href': serializer.get_detail_url_template(self.name, context),
                 'type': serializer.TYPE
             }
-        data = OrderedDict()
-        if links:
-            data['links'] = links
-        data[self.name] = serialized_data
-        if linked:
-            data['linked'] = linked
-        return data
+        return links
 
     def compile_links(self, paths, context, serializer_path_prefix=None):
         if not serializer_path_prefix:
             serializer_path_prefix = ''
         links = {}
+        request = context.get('request')
         for path in paths:
-            s_path = serializer_path_prefix + path
-            s_class = self.get_serializer_class(s_path)
-            s = s_class()
+            info = self.resolve_path(serializer_path_prefix + path, path)
+            if info.url_template is None:
+                href = info.serializer_class().get_detail_url_template(path, context)
+            elif request is None:
+                href = info.url_template
+            else:
+                href = get_url_base(request) + info.url_template
             links[path] = {
-                'href': s.get_detail_url_template(path, context),
-                'type': s.TYPE
+                'href': href,
+                'type': info.serializer_class.TYPE
             }
         return links
 
     def get_serializer_class(self, path):
+        return self.resolve_path(path).serializer_class
+
+    def resolve_path(self, path, link_name=None):
+        """
+        Resolves a serializer path like ``posts.comments.author`` to a
+        ``PathInfo``.
+
+        The URL template is the (unquoted) path of the link ``link_name``.
+        It's ``None`` without a ``link_name`` or when the template depends
+        on the context. Results are cached process wide.
+
+        """
+        return path_cache.get((path, link_name),
+                              lambda: self._resolve_path(path, link_name))
+
+    def _resolve_path(self, path, link_name):
         parts = path.split('.')
+        rel_type = parts[0]
         cls = class_registry.get_class(parts[0])
         for part in parts[1:]:
             links = cls().fields.get('links')
@@ -135,39 +352,147 @@ class JsonApiSerializer(object):
                                            '(path: %s)' % (part, path))
             rel_type = relation_field.get_relation_type()
             cls = class_registry.get_class(rel_type)
-        return cls
+        url_template = None
+        if link_name is not None and has_static_url_template(cls):
+            relative = cls().get_relative_detail_url_template(link_name, {})
+            url_template = urllib.unquote(iri_to_uri(relative)).decode('utf-8')
+        return PathInfo(cls, rel_type, url_template)
+
+    def get_include_tree(self, serializer):
+        """
+        Returns the relations to load as nested dicts of relation names.
+
+        """
+        if self.include is not None:
+            return parse_include(self.name, self.include)
+        field = serializer.fields.get('links')
+        if not field:
+            return OrderedDict()
+        return OrderedDict((name, OrderedDict()) for name in field.link_fields)
 
-    def serialize_linked(self, serializer, ids_by_type):
+    def serialize_linked(self, serializer, ids_by_name):
+        """
+        Serializes the resources of the included relations.
+
+        The include tree is walked level by level. On every level the ids of
+        all relations are merged by relation type (e.g. an ``author`` and a
+        ``reviewer`` link both of type ``people``) and each type is fetched
+        with a single query, skipping the resources loaded on previous
+        levels. Every resource ends up in ``linked`` once.
+
+        """
         linked = {}
-        field = serializer.fields.get('links')
         require_link = []
-        if not field:
-            return linked, require_link
-        for field_name, relationship_field in field.link_fields.items():
-            rel_type = relationship_field.get_relation_type()
-            ids = ids_by_type.get(rel_type)
-            if not ids:
-                continue
+        loaded = defaultdict(dict)
+        # Every node is (path, serializer, ids by link name, subtree)
+        level = [(None, serializer, ids_by_name, self.get_include_tree(serializer))]
+        while level:
+            fields_by_type = OrderedDict()
+            ids_by_type = defaultdict(set)
+            wanted = []
+            for path, parent, by_name, subtree in level:
+                field = parent.fields.get('links')
+                if not field:
+                    continue
+                for name, children in subtree.items():
+                    relationship_field = field.link_fields.get(name)
+                    if relationship_field is None:
+                        continue
+                    rel_type = relationship_field.get_relation_type()
+                    ids = by_name.get(name, set())
+                    fields_by_type.setdefault(rel_type, []).append(
+                        (name, relationship_field, parent))
+                    ids_by_type[rel_type] |= ids
+                    child_path = name if path is None else '%s.%s' % (path, name)
+                    wanted.append((child_path, rel_type, ids, children))
+            jobs = []
+            for rel_type, link_fields in fields_by_type.items():
+                items = loaded[rel_type]
+                ids = [pk for pk in ids_by_type[rel_type] if pk not in items]
+                if ids:
+                    jobs.append((rel_type, link_fields, ids))
+            # Types are merged in the order of the include tree, even when
+            # they were loaded concurrently
+            for job, result in zip(jobs, self.load_linked(jobs)):
+                rel_type = job[0]
+                instances, pk_field, serialized_data = result
+                items = loaded[rel_type]
+                for instance, item in zip(instances, serialized_data):
+                    items['%s' % getattr(instance, pk_field)] = item
+                linked.setdefault(rel_type, []).extend(serialized_data)
+            next_level = []
+            for path, rel_type, ids, children in wanted:
+                items = loaded[rel_type]
+                serialized_data = [items[pk] for pk in ids if pk in items]
+                if not serialized_data:
+                    continue
+                rel_serializer = self.get_serializer_class(rel_type)()
+                # Now collect ids for "linked" links so we know which ones
+                # require a URL template
+                x, sub_by_name = self.collect_ids(serialized_data, rel_serializer)
+                for name in sub_by_name.keys():
+                    require_link.append('%s.%s' % (path, name))
+                if children:
+                    next_level.append((path, rel_serializer, sub_by_name, children))
+            level = next_level
+        return linked, require_link
+
+    def load_linked(self, jobs):
+        """
+        Fetches and marshals the ``(relation type, link fields, ids)``
+        ``jobs``, concurrently on the ``executor`` when there is one (see
+        ``machete.concurrency``). Returns ``(instances, pk field,
+        serialized data)`` for every job, in order.
+
+        """
+        if self.executor is None:
+            return [self.load_linked_type(*job) for job in jobs]
+        active = get_identity_map()
+
+        def load(job):
+            # Pool threads read the identity map of the request but register
+            # their instances in a map of their own
+            forked = active.fork() if active is not None else None
+            with use_identity_map(forked):
+                return forked, self.load_linked_type(*job)
+
+        results = []
+        for forked, result in self.executor.map(load, jobs):
+            if forked is not None:
+                active.merge(forked)
+            results.append(result)
+        return results
+
+    def load_linked_type(self, rel_type, link_fields, ids):
+        instances, pk_field = self.get_linked_instances(link_fields, ids)
+        rel_serializer_class = self.get_serializer_class(rel_type)
+        rel_serializer = rel_serializer_class(instances, many=True)
+        return instances, pk_field, rel_serializer.data
+
+    def get_linked_instances(self, link_fields, ids):
+        """
+        Fetches the instances for ``ids`` using the first of ``link_fields``
+        (all of the same relation type) that knows its model or queryset.
+
+        Returns the instances and the name of the field the ids refer to.
+
+        """
+        for field_name, relationship_field, parent in link_fields:
             try:
                 instances = relationship_field.get_instances(ids)
             except RelationIdField.Misconfigured:
-                s_name = serializer.__class__.__name__
-                msg_data = {'field_name': field_name, 'serializer': s_name}
-                msg = ('Specify a model or queryset for RelationIdField '
-                       '"%(field_name)s" in serializer %(serializer)s or '
-                       'prevent the construction of compound '
-                       'documents.') % msg_data
-                raise ImproperlyConfigured(msg)
-            rel_serializer_class = self.get_serializer_class(rel_type)
-            rel_serializer = rel_serializer_class(instances, many=True)
-            serialized_data = rel_serializer.data
-            linked[rel_type] = serialized_data
-            # Now collect ids for "linked" links so we know which ones require
-            # a URL template (no embedded of links in "linked" for now)
-            x, sub_by_name = self.collect_ids(serialized_data, rel_serializer)
-            for name, ids in sub_by_name.items():
-                require_link.append('%s.%s' % (field_name, name))
-        return linked, require_link
+                continue
+            # Cached lookups yield None for pks that don't exist
+            instances = [i for i in instances if i is not None]
+            return instances, relationship_field.pk_field
+        field_name, relationship_field, parent = link_fields[0]
+        s_name = parent.__class__.__name__
+        msg_data = {'field_name': field_name, 'serializer': s_name}
+        msg = ('Specify a model or queryset for RelationIdField '
+               '"%(field_name)s" in serializer %(serializer)s or '
+               'prevent the construction of compound '
+               'documents.') % msg_data
+        raise ImproperlyConfigured(msg)
 
     def collect_ids(self, data, serializer):
         link_fields = serializer.fields.get('links')
@@ -201,7 +526,198 @@ def serialize_to_json(name, *args, **kwargs):
 def serialize(name, *args, **kwargs):
     compound = kwargs.pop('compound', False)
     self_link = kwargs.pop('self_link', False)
-    return JsonApiSerializer(name, compound=compound, self_link=self_link).serialize(*args, **kwargs)
+    include = kwargs.pop('include', None)
+    fragment_cache = kwargs.pop('fragment_cache', None)
+    executor = kwargs.pop('executor', None)
+    return JsonApiSerializer(name, compound=compound, self_link=self_link, include=include, fragment_cache=fragment_cache, executor=executor).serialize(*args, **kwargs)
+
+
+def stream(name, data, encode, *args, **kwargs):
+    compound = kwargs.pop('compound', False)
+    self_link = kwargs.pop('self_link', False)
+    include = kwargs.pop('include', None)
+    fragment_cache = kwargs.pop('fragment_cache', None)
+    executor = kwargs.pop('executor', None)
+    return JsonApiSerializer(name, compound=compound, self_link=self_link, include=include, fragment_cache=fragment_cache, executor=executor).stream(data, encode, *args, **kwargs)
+
+
+def parse_include(name, include):
+    """
+    Turns a list of include paths (``comments``, ``comments.author``) of
+    the resource ``name`` into nested dicts of relation names.
+
+    Raises ``InvalidInclude`` for relations the serializers don't link.
+
+    """
+    tree = OrderedDict()
+    for path in include:
+        node = tree
+        cls = class_registry.get_class(name)
+        for part in path.split('.'):
+            links = cls().fields.get('links')
+            link_field = links.link_fields.get(part) if links else None
+            if link_field is None:
+                raise InvalidInclude('Unknown relation "%s" in include path '
+                                     '"%s"' % (part, path))
+            node = node.setdefault(part, OrderedDict())
+            cls = class_registry.get_class(link_field.get_relation_type())
+    return tree
+
+
+def to_absolute_url_template(relative, context):
+    url = to_absolute_url(relative, context.get('request'))
+    return urllib.unquote(url).decode('utf-8')
+
+
+def has_static_url_template(serializer_class):
+    """
+    Tells whether the detail URL templates of ``serializer_class`` are
+    independent of the context, i.e. it doesn't override how they're built.
+
+    """
+    if not issubclass(serializer_class, ContextSerializer):
+        return False
+    for name in ('get_detail_url_template', 'get_relative_detail_url_template',
+                 'get_detail_url_template_kwargs'):
+        method = getattr(serializer_class, name).__func__
+        if method is not getattr(ContextSerializer, name).__func__:
+            return False
+    return True
+
+
+def get_required_columns(serializer, opts):
+    """
+    Returns the names of the fields of the model described by ``opts`` the
+    fields of ``serializer`` read, or ``None`` when that can't be told.
+
+    Declare what fields that can't be inferred (like ``Method`` fields)
+    need in the ``columns`` option of the serializer.
+
+    """
+    declared = getattr(serializer.opts, 'columns', {})
+    columns = set([opts.pk.name])
+    for name, field in serializer.fields.items():
+        if name in declared:
+            columns.update(declared[name])
+            continue
+        needed = get_field_columns(field, name, opts)
+        if needed is None:
+            return None
+        columns.update(needed)
+    return columns
+
+
+def get_field_columns(field, name, opts):
+    get_required = getattr(field, 'get_required_columns', None)
+    if get_required is not None:
+        return get_required(name, opts)
+    if isinstance(field, (fields.Method, fields.Function, fields.Nested)):
+        return None
+    attribute = field.attribute or name
+    if attribute == 'pk':
+        return []
+    if '.' in attribute:
+        return None
+    try:
+        model_field = opts.get_field(attribute)
+    except FieldDoesNotExist:
+        return None
+    if not model_field.concrete or model_field.many_to_many:
+        return None
+    return [model_field.name]
+
+
+def get_values_columns(serializer, opts):
+    """
+    Returns the names to pass to ``QuerySet.values()`` so the fields of
+    ``serializer`` can read the resulting dicts like they read instances of
+    the model described by ``opts``, or ``None`` when some field needs an
+    instance.
+
+    Only fields reading a concrete, non relational column under its own
+    name and links reading a foreign key qualify (see
+    ``get_field_values_columns``). Fields with declared ``columns`` need an
+    instance.
+
+    """
+    declared = getattr(serializer.opts, 'columns', {})
+    columns = []
+    for name, field in serializer.fields.items():
+        if name in declared:
+            return None
+        needed = get_field_values_columns(field, name, opts)
+        if needed is None:
+            return None
+        columns.extend(c for c in needed if c not in columns)
+    return columns
+
+
+def get_field_values_columns(field, name, opts):
+    get_values = getattr(field, 'get_values_columns', None)
+    if get_values is not None:
+        return get_values(name, opts)
+    if isinstance(field, (fields.Method, fields.Function, fields.Nested)):
+        return None
+    if not isinstance(field, fields.Raw):
+        return None
+    attribute = field.attribute or name
+    if attribute == 'pk':
+        return [attribute]
+    try:
+        model_field = opts.get_field(attribute)
+    except FieldDoesNotExist:
+        return None
+    if (model_field.name != attribute or not model_field.concrete or
+            model_field.is_relation):
+        return None
+    return [attribute]
+
+
+def get_related_loads(serializer, opts):
+    """
+    Returns the ``(select_related, prefetch_related)`` lookups that load
+    what the links of ``serializer`` read from instances of the model
+    described by ``opts`` up front, instead of once per object.
+
+    Links batching their ids per collection (see ``ToManyIdField``) or
+    reading a foreign key column don't need any.
+
+    """
+    links = serializer.fields.get('links')
+    if not isinstance(links, LinksField):
+        return [], []
+    return links.get_related_loads('links', opts)
+
+
+def load_related(queryset, serializer):
+    """Applies ``get_related_loads`` of ``serializer`` to ``queryset``."""
+    model = getattr(queryset, 'model', None)
+    if model is None or not hasattr(queryset, 'prefetch_related'):
+        return queryset
+    select, prefetch = get_related_loads(serializer, model._meta)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        # Leave the lookups the queryset prefetches already alone, Django
+        # refuses the same lookup with another queryset
+        existing = compat.get_prefetch_lookups(queryset)
+        prefetch = [lookup for lookup in prefetch
+                    if getattr(lookup, 'prefetch_to', lookup) not in existing]
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def group_related_pks(pairs):
+    """
+    Groups ``(parent pk, related pk)`` pairs into a dict mapping each parent
+    pk to the list of its related pks, all as strings.
+
+    """
+    grouped = defaultdict(list)
+    for parent_pk, related_pk in pairs:
+        grouped['%s' % parent_pk].append('%s' % related_pk)
+    return grouped
 
 
 class UtcDateTime(fields.Raw):
@@ -233,6 +749,9 @@ class RelationIdField(fields.Raw):
 
     """
 
+    #: Maximum number of parent pks per query when loading links in batch
+    batch_size = 500
+
     class Misconfigured(Exception):
         pass
 
@@ -245,28 +764,29 @@ class RelationIdField(fields.Raw):
         self.use_caching = kwargs.pop('use_caching', False)
         super(RelationIdField, self).__init__(*args, **kwargs)
 
-    @property
-    def cache(self):
-        return getattr(threadlocal, 'cache', None)
-
     def get_instances(self, pks):
+        """
+        Loads the instances for ``pks`` and registers them in the identity
+        map of the request. With ``use_caching`` the instances the map
+        holds already are reused; missing pks yield ``None`` then.
+
+        """
+        active = get_identity_map()
+        queryset = self.get_queryset(pks)
+        if active is None:
+            return queryset.all()
         if not self.use_caching:
-            return self.get_queryset(pks).all()
-        non_cached_pks = []
-        rel_type = self.get_relation_type()
-        cache = self.cache.get(rel_type, None)
-        if not cache:
-            cache = {}
-        for pk in pks:
-            if not cache.get('%s' % pk):
-                non_cached_pks.append('%s' % pk)
-        if non_cached_pks:
-            non_cached = self.get_queryset(non_cached_pks).all()
-            for item in non_cached:
-                cache['%s' % item.pk] = item
-            self.cache[rel_type] = cache
-        results = [cache.get('%s' % pk) for pk in pks]
-        return results
+            instances = list(queryset)
+            active.add_many(instances, self.pk_field)
+            return instances
+        found = active.get_many(queryset.model, pks, self.pk_field)
+        missing = ['%s' % pk for pk in pks if '%s' % pk not in found]
+        if missing:
+            instances = list(self.get_queryset(missing))
+            active.add_many(instances, self.pk_field)
+            for instance in instances:
+                found['%s' % getattr(instance, self.pk_field)] = instance
+        return [found.get('%s' % pk) for pk in pks]
 
     def get_queryset(self, pks):
         queryset = None
@@ -283,7 +803,12 @@ class RelationIdField(fields.Raw):
         else:
             raise self.Misconfigured('missing_model_queryset')
         filter = {'%s__in' % self.pk_field: pks}
-        return queryset.filter(**filter)
+        queryset = queryset.filter(**filter)
+        try:
+            serializer_class = class_registry.get_class(self.get_relation_type())
+        except RegistryError:
+            return queryset
+        return load_related(queryset, serializer_class())
 
     def get_relation_type(self):
         relation_type = self.relation_type
@@ -291,6 +816,45 @@ class RelationIdField(fields.Raw):
             return self.name
         return relation_type
 
+    def get_batch(self, key):
+        batches = getattr(self.parent, 'link_batches', None)
+        return batches.get(key) if batches else None
+
+    def load_batch(self, key, objs, serializer):
+        """
+        Loads the link values of all ``objs`` at once.
+
+        Returns a dict mapping the (string) pk of every object to its value
+        or ``None`` when the relation doesn't support batch loading, in
+        which case ``output`` resolves the link per object.
+
+        """
+        return None
+
+    def get_required_columns(self, key, opts):
+        """
+        Returns the names of the model fields the link reads or ``None``
+        when that's unknown.
+
+        """
+        return None
+
+    def get_values_columns(self, key, opts):
+        """
+        Returns the keys the link reads from ``values()`` rows or ``None``
+        when it needs model instances.
+
+        """
+        return None
+
+    def get_related_loads(self, key, opts):
+        """
+        Returns the ``select_related`` and ``prefetch_related`` lookups the
+        link needs to be read without a query per object.
+
+        """
+        return [], []
+
     def get_related(self, key, obj):
         if self.method:
             method = getattr(self.parent, self.method)
@@ -302,15 +866,91 @@ class RelationIdField(fields.Raw):
 
 
 class ToManyIdField(RelationIdField):
+    """
+    Maps a to-many relationship to a list of ids.
+
+    When serializing a collection the ids for all objects are loaded with a
+    single query per relationship (see ``load_batch``) unless ``batch`` is
+    ``False`` or ``assume_prefetched`` is set. Unbatched links are
+    prefetched automatically (see ``get_related_loads``); with
+    ``assume_prefetched`` the queryset of the endpoint has to prefetch them.
+
+    Links using ``method`` can be batched as well by adding a
+    ``<method>_batch`` method to the serializer. It receives the list of
+    objects and the context and returns ``(parent pk, related pk)`` pairs,
+    e.g. from a ``values_list`` query.
+
+    """
 
     def __init__(self, *args, **kwargs):
         self.assume_prefetched = kwargs.pop('assume_prefetched', False)
+        self.batch = kwargs.pop('batch', True)
         super(ToManyIdField, self).__init__(*args, **kwargs)
 
+    def get_required_columns(self, key, opts):
+        # Related managers only need the pk
+        return None if self.method else []
+
+    def get_related_loads(self, key, opts):
+        # Batched links cost a single query without instances, the
+        # queryset takes care of assume_prefetched links
+        if self.method or self.batch or self.assume_prefetched:
+            return [], []
+        attribute = key if self.attribute is None else self.attribute
+        relation = compat.get_related_lookup(opts, attribute)
+        if relation is None:
+            return [], []
+        related_model, lookup = relation
+        related_opts = related_model._meta
+        columns = [related_opts.pk.name if self.pk_field == 'pk' else self.pk_field]
+        try:
+            back = related_opts.get_field(lookup)
+        except FieldDoesNotExist:
+            back = None
+        if back is not None and back.concrete and not back.many_to_many:
+            # Prefetching a reverse foreign key reads it on the related side
+            columns.append(back.name)
+        queryset = related_model._default_manager.only(*columns)
+        return [], [Prefetch(attribute, queryset=queryset)]
+
+    def load_batch(self, key, objs, serializer):
+        if self.assume_prefetched or not self.batch:
+            return None
+        if self.method:
+            hook = getattr(serializer, '%s_batch' % self.method, None)
+            if hook is None:
+                return None
+            return group_related_pks(hook(objs, serializer.context))
+        opts = getattr(objs[0], '_meta', None)
+        if opts is None:
+            return None
+        if compat.get_prefetched(self.get_related(key, objs[0])) is not None:
+            # Read from the prefetched objects instead
+            return None
+        attribute = key if self.attribute is None else self.attribute
+        relation = compat.get_related_lookup(opts, attribute)
+        if relation is None:
+            return None
+        related_model, lookup = relation
+        pks = [obj.pk for obj in objs]
+        pairs = []
+        for i in range(0, len(pks), self.batch_size):
+            filter = {'%s__in' % lookup: pks[i:i + self.batch_size]}
+            qs = related_model._default_manager.filter(**filter)
+            pairs.extend(qs.values_list('%s__pk' % lookup, self.pk_field))
+        return group_related_pks(pairs)
+
     def output(self, key, obj):
+        batch = self.get_batch(key)
+        if batch is not None:
+            return batch.get('%s' % obj.pk) or None
         related = self.get_related(key, obj)
         if self.assume_prefetched:
             return ['%s' % getattr(i, self.pk_field) for i in related.all()]
+        prefetched = compat.get_prefetched(related)
+        if prefetched is not None:
+            values = ['%s' % getattr(i, self.pk_field) for i in prefetched]
+            return values if values else None
         if hasattr(related, 'values_list'):
             values = related.values_list(self.pk_field, flat=True)
             values = ['%s' % pk for pk in values]
@@ -319,19 +959,76 @@ class ToManyIdField(RelationIdField):
 
 
 class ToOneIdField(RelationIdField):
+    """
+    Maps a to-one relationship to an id.
+
+    When the relationship is a foreign key on the model of the serialized
+    object pointing to ``pk_field``, the id is read straight from the
+    foreign key column (e.g. ``author_id``) without loading the related
+    object. Pass ``simple_id_field`` to name that column yourself.
+
+    """
 
     def __init__(self, *args, **kwargs):
         self.simple_id_field = kwargs.pop('simple_id_field', None)
+        self.id_attnames = {}
         super(ToOneIdField, self).__init__(*args, **kwargs)
 
+    def get_required_columns(self, key, opts):
+        if self.method:
+            return None
+        attribute = key if self.attribute is None else self.attribute
+        if '.' in attribute:
+            return None
+        if compat.get_foreign_key_attname(opts, attribute, self.pk_field):
+            return [attribute]
+        return None
+
+    def get_related_loads(self, key, opts):
+        if self.method or self.simple_id_field:
+            return [], []
+        if self.get_required_columns(key, opts) is not None:
+            # Read from the foreign key column
+            return [], []
+        attribute = key if self.attribute is None else self.attribute
+        lookup = compat.get_to_one_lookup(opts, attribute)
+        return ([lookup] if lookup else []), []
+
+    def get_values_columns(self, key, opts):
+        # values() returns the foreign key under the name of the relation
+        if self.simple_id_field:
+            return None
+        return self.get_required_columns(key, opts)
+
+    def get_id_attname(self, key, obj):
+        if self.method:
+            return None
+        opts = getattr(obj, '_meta', None)
+        if opts is None:
+            return None
+        model = opts.model
+        if model not in self.id_attnames:
+            attribute = key if self.attribute is None else self.attribute
+            attname = None
+            if '.' not in attribute:
+                attname = compat.get_foreign_key_attname(opts, attribute,
+                                                         self.pk_field)
+            self.id_attnames[model] = attname
+        return self.id_attnames[model]
+
     def output(self, key, obj):
         value = None
-        if self.simple_id_field:
-            value = getattr(obj, self.simple_id_field, None)
+        if isinstance(obj, dict):
+            # A values() row, see get_values_columns
+            value = obj.get(key if self.attribute is None else self.attribute)
         else:
-            related = self.get_related(key, obj)
-            if related:
-                value = getattr(related, self.pk_field)
+            id_field = self.simple_id_field or self.get_id_attname(key, obj)
+            if id_field:
+                value = getattr(obj, id_field, None)
+            else:
+                related = self.get_related(key, obj)
+                if related:
+                    value = getattr(related, self.pk_field)
         if value is not None:
             return '%s' % value
         return None
@@ -341,19 +1038,74 @@ class LinksField(fields.Raw):
 
     def __init__(self, link_fields, **kwargs):
         self.link_fields = link_fields
+        for name, link_field in link_fields.items():
+            # The name is the default relation type
+            link_field.name = name
         super(LinksField, self).__init__(**kwargs)
 
+    def load_batches(self, objs, serializer):
+        batches = {}
+        for name, link_field in self.link_fields.items():
+            load_batch = getattr(link_field, 'load_batch', None)
+            if load_batch is None:
+                continue
+            batch = load_batch(name, objs, serializer)
+            if batch is not None:
+                batches[name] = batch
+        return batches
+
+    def get_required_columns(self, key, opts):
+        columns = []
+        for name, link_field in self.link_fields.items():
+            needed = get_field_columns(link_field, name, opts)
+            if needed is None:
+                return None
+            columns.extend(needed)
+        return columns
+
+    def get_related_loads(self, key, opts):
+        select, prefetch = [], []
+        for name, link_field in self.link_fields.items():
+            get_loads = getattr(link_field, 'get_related_loads', None)
+            if get_loads is None:
+                continue
+            link_select, link_prefetch = get_loads(name, opts)
+            select.extend(link_select)
+            prefetch.extend(link_prefetch)
+        return select, prefetch
+
+    def get_values_columns(self, key, opts):
+        columns = []
+        for name, link_field in self.link_fields.items():
+            get_values = getattr(link_field, 'get_values_columns', None)
+            needed = get_values(name, opts) if get_values else None
+            if needed is None:
+                return None
+            columns.extend(needed)
+        return columns
+
     def field_by_relation_type(self, relation_type):
         for name, field in self.link_fields.items():
             if field.get_relation_type() == relation_type:
                 return field
         return None
 
+    def bind(self, parent):
+        # The link fields read the serializer (context, link batches), so
+        # each serializer needs its own copies of them too
+        ret = super(LinksField, self).bind(parent)
+        link_fields = self.link_fields.__class__()
+        for name, link_field in self.link_fields.items():
+            link_field = link_field.bind(ret.parent)
+            link_field.parent = ret.parent
+            link_field.name = name
+            link_fields[name] = link_field
+        ret.link_fields = link_fields
+        return ret
+
     def output(self, key, obj):
         links = {}
         for name, link_field in self.link_fields.items():
-            link_field.parent = self.parent
-            link_field.name = name
             links[name] = link_field.output(name, obj)
         return links
 
@@ -376,6 +1128,9 @@ class AutoHrefField(fields.Raw):
         super(AutoHrefField, self).__init__(**kwargs)
         self.resource_name = resource_name
 
+    def get_required_columns(self, key, opts):
+        return []
+
     def output(self, key, obj):
         # TODO There's still an issue with nested components in which
         # the context isn't passed
@@ -387,36 +1142,57 @@ class AutoHrefField(fields.Raw):
 class Options(serializer.SerializerOpts):
 
     def __init__(self, meta):
-        model = getattr(meta, 'model', None)
-        if model:
-            self.model = model
-            additional = getattr(meta, 'additional', None)
-            additional = [] if not additional else list(additional)
-            opts = model._meta
+        super(Options, self).__init__(meta)
+        self.model = getattr(meta, 'model', None)
+        # Model fields read by serializer fields that can't be inferred,
+        # e.g. {'summary': ['content']} for a Method field
+        self.columns = getattr(meta, 'columns', {})
+        if self.model:
+            additional = list(self.additional)
+            opts = self.model._meta
             for name in compat.get_all_field_names(opts):
                 field, model, direct, m2m = compat.get_field_by_name(opts, name)
                 link = isinstance(field, (ForeignKey, ManyToManyField,))
                 if direct and not link:
                     additional.append(name)
-            setattr(meta, 'additional', additional)
-        super(Options, self).__init__(meta)
+            if self.fields and additional:
+                raise ValueError("Cannot set both `fields` and `additional` "
+                                 "options for the same serializer.")
+            self.additional = additional
 
 
 class ContextSerializer(Serializer):
     OPTIONS_CLASS = Options
 
     def get_detail_url_template(self, path, context):
-        import urllib
+        relative = self.get_relative_detail_url_template(path, context)
+        return to_absolute_url_template(relative, context)
+
+    def get_relative_detail_url_template(self, path, context):
         name = create_resource_view_name(self.TYPE)
         kwargs = self.get_detail_url_template_kwargs(path, context)
-        relative = get_resource_url_template(name, '{%s}' % path, kwargs=kwargs)
-        url = to_absolute_url(relative, context.get('request'))
-        return urllib.unquote(url).decode('utf-8')
+        return get_resource_url_template(name, '{%s}' % path, kwargs=kwargs)
 
     def get_detail_url_template_kwargs(self, path, context, **kwargs):
         return kwargs
 
+    def load_link_batches(self):
+        """
+        Resolves the links of a collection per relationship instead of per
+        object. The results are exposed to the link fields as
+        ``link_batches``.
+
+        """
+        links = self.fields.get('links')
+        if not self.many or not isinstance(links, LinksField):
+            return {}
+        objs = list(self.obj) if self.obj is not None else []
+        if not objs:
+            return {}
+        return links.load_batches(objs, self)
+
     def _update_data(self):
+        self.link_batches = self.load_link_batches()
         super(ContextSerializer, self)._update_data()
         data = self._data
         if self.many:
@@ -2,8 +2,45 @@
 from __future__ import (unicode_literals, print_function, division,
                         absolute_import)
 
-from django.core.urlresolvers import reverse
+import re
+import threading
+
+from django.core.urlresolvers import (reverse, get_script_prefix, get_urlconf,
+                                      NoReverseMatch)
+from django.core.signals import setting_changed
 from django.conf.urls import url as url_pattern
+from django.utils.encoding import iri_to_uri
+from django.utils.http import urlquote, RFC3986_SUBDELIMS
+
+PKS_PATTERN = r'[\w|\-|,]+'
+
+#: Pk slot patterns of the detail views registered by ``patterns_for``
+_pk_slots = {}
+#: Compiled URL templates per view name, script prefix and URLconf
+_url_templates = {}
+_url_templates_lock = threading.Lock()
+
+
+class UrlTemplate(object):
+    """
+    The path of a detail view split around its pks slot, so URLs are
+    rendered by string concatenation instead of ``reverse``.
+
+    """
+
+    def __init__(self, prefix, suffix, pks_pattern=PKS_PATTERN):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.pks_regex = re.compile(r'^%s$' % pks_pattern, re.UNICODE)
+
+    def render(self, pks):
+        if not self.pks_regex.match(pks):
+            raise NoReverseMatch('Invalid pks %r for %s' % (pks, self.prefix))
+        pks = urlquote(pks, safe=RFC3986_SUBDELIMS + str('/~:@'))
+        return self.prefix + pks + self.suffix
+
+    def render_template(self, template):
+        return self.prefix + template + self.suffix
 
 
 def patterns_for(endpoint_cls, relationship_name=None, to_many=False, **initkwargs):
@@ -28,15 +65,65 @@ def patterns_for(endpoint_cls, relationship_name=None, to_many=False, **initkwar
             urls.append((detail_url, '%s_detail' % base_name))
     else:
         urls.append((endpoint_url, 'api_%s' % resource_name))
-        detail_url = r'%s/(?P<pks>([\w|\-|,]+))' % endpoint_url
-        urls.append((detail_url, 'api_%s_detail' % resource_name))
+        detail_url = r'%s/(?P<pks>(%s))' % (endpoint_url, PKS_PATTERN)
+        detail_name = create_resource_view_name(resource_name)
+        urls.append((detail_url, detail_name))
+        _pk_slots[detail_name] = PKS_PATTERN
     urls = [(r'^%s$' % url, name) for url, name in urls]
     urls = [url_pattern(url, endpoint, name=name) for url, name in urls]
     return urls
 
 
+def get_url_template(viewname):
+    """
+    Returns the ``UrlTemplate`` of a detail view registered by
+    ``patterns_for`` or ``None`` for any other view.
+
+    Where the patterns are included is only known to the URLconf, so the
+    first call per view name (and script prefix) does a single ``reverse``.
+
+    """
+    pks_pattern = _pk_slots.get(viewname)
+    if pks_pattern is None:
+        return None
+    key = (viewname, get_script_prefix(), get_urlconf())
+    url_template = _url_templates.get(key)
+    if url_template is None:
+        placeholder = '123456789'
+        url = reverse(viewname, kwargs={'pks': placeholder})
+        prefix, suffix = url.split(placeholder, 1)
+        url_template = UrlTemplate(prefix, suffix, pks_pattern)
+        with _url_templates_lock:
+            _url_templates[key] = url_template
+    return url_template
+
+
+def clear_url_templates(**kwargs):
+    if kwargs['setting'] == 'ROOT_URLCONF':
+        with _url_templates_lock:
+            _url_templates.clear()
+
+
+setting_changed.connect(clear_url_templates)
+
+
+def get_url_base(request):
+    """
+    Returns the scheme and host of ``request``, computed once per request.
+
+    """
+    try:
+        return request._machete_url_base
+    except AttributeError:
+        base = '%s://%s' % (request.scheme, request.get_host())
+        request._machete_url_base = base
+        return base
+
+
 def to_absolute_url(relative_url, request=None):
     if request:
+        if relative_url.startswith('/') and not relative_url.startswith('//'):
+            return iri_to_uri(get_url_base(request) + relative_url)
         return request.build_absolute_uri(relative_url)
     # TODO Use some setting
     return relative_url
@@ -44,8 +131,13 @@ def to_absolute_url(relative_url, request=None):
 
 def get_resource_detail_url(name, pks, **kwargs):
     pks = ','.join('%s' % i for i in pks)
+    viewname = create_resource_view_name(name)
+    if not kwargs:
+        url_template = get_url_template(viewname)
+        if url_template is not None:
+            return url_template.render(pks)
     kwargs['pks'] = pks
-    return reverse(create_resource_view_name(name), kwargs=kwargs)
+    return reverse(viewname, kwargs=kwargs)
 
 
 def create_resource_view_name(resource_name):
@@ -55,6 +147,10 @@ def create_resource_view_name(resource_name):
 def get_resource_url_template(viewname, template, urlconf=None, kwargs=None, prefix=None, current_app=None, ids_group_name=None):
     if not ids_group_name:
         ids_group_name = 'pks'
+    if not kwargs and not urlconf and not prefix and ids_group_name == 'pks':
+        url_template = get_url_template(viewname)
+        if url_template is not None:
+            return url_template.render_template(template)
     if not kwargs:
         kwargs = {}
     placeholder = '123456789'
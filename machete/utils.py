@@ -2,8 +2,12 @@
 from __future__ import (unicode_literals, print_function, division,
                         absolute_import)
 
+from itertools import islice
+
 from django.core.exceptions import ImproperlyConfigured
 
+from . import compat
+
 
 class RequestPayloadDescriptor(object):
 
@@ -28,13 +32,14 @@ class RequestRelationshipDescriptor(object):
 
 class RequestResourceDescriptor(object):
 
-    def __init__(self, name, pks=None, relationship_descriptor=None, fields=None):
+    def __init__(self, name, pks=None, relationship_descriptor=None, fields=None, include=None):
         self.name = name
         self.pks = pks if pks else []
         self.nr_pks = len(self.pks)
         self.pk = None if self.nr_pks != 1 else self.pks[0]
         self.relationship_descriptor = relationship_descriptor
         self.fields = fields
+        self.include = include
 
     @property
     def to_many(self):
@@ -59,6 +64,13 @@ class RequestContext(object):
         self.resource_descriptor = resource_descriptor
         self.status = status
         self.mode = None
+        self.page = None
+        self.etag = None
+        self.etag_generated = False
+        self.etag_task = None
+        self.filtered_queryset = None
+        self.missing_pks = None
+        self.columns = None
 
     def update_mode(self, request_method):
         self.mode = self.determine_mode(request_method)
@@ -80,8 +92,8 @@ class RequestContext(object):
         return None
 
     @classmethod
-    def create_resource_descriptor(cls, name, pks=None, relationship_descriptor=None, fields=None):
-        return RequestResourceDescriptor(name, pks, relationship_descriptor, fields=fields)
+    def create_resource_descriptor(cls, name, pks=None, relationship_descriptor=None, fields=None, include=None):
+        return RequestResourceDescriptor(name, pks, relationship_descriptor, fields=fields, include=include)
 
     @classmethod
     def create_relationship_descriptor(cls, name, pks=None, many=False):
@@ -150,3 +162,67 @@ def pluck_ids(data, name=None):
     if not isinstance(items, list):
         items = [items]
     return ['%s' % i['id'] for i in items]
+
+
+def chunked(items, size):
+    """
+    Splits ``items`` in lists of at most ``size`` items.
+
+    Querysets ordered on their primary key (or not ordered at all) are
+    fetched a chunk at a time with keyset queries (see
+    ``get_keyset_pk_key``), so only a chunk is held in memory. Other
+    querysets are consumed through ``iterator()``, which doesn't cache the
+    results but still has most database drivers fetch all rows at once
+    before Django 1.11 (no server-side cursors).
+
+    """
+    pk_key = get_keyset_pk_key(items)
+    if pk_key is not None:
+        for chunk in keyset_chunked(items, size, pk_key):
+            yield chunk
+        return
+    iterator = items.iterator() if hasattr(items, 'iterator') else iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def get_keyset_pk_key(queryset):
+    """
+    Returns how to read the primary key of the rows of ``queryset`` when it
+    can be fetched in chunks of ``pk > last pk`` without changing the order
+    of its rows (see ``compat.get_row_pk_key``), ``None`` otherwise.
+
+    """
+    model = getattr(queryset, 'model', None)
+    query = getattr(queryset, 'query', None)
+    if model is None or query is None:
+        return None
+    if query.low_mark or query.high_mark is not None or query.extra_order_by:
+        # Sliced or ordered on extra()
+        return None
+    ordering = query.order_by
+    if not ordering and query.default_ordering:
+        ordering = model._meta.ordering
+    pk = model._meta.pk
+    if any(o not in ('pk', pk.name, pk.attname) for o in ordering):
+        return None
+    return compat.get_row_pk_key(queryset)
+
+
+def keyset_chunked(queryset, size, pk_key):
+    """Yields the rows of ``queryset`` in chunks of ``pk > last pk``."""
+    queryset = queryset.order_by('pk')
+    last = None
+    while True:
+        qs = queryset if last is None else queryset.filter(pk__gt=last)
+        chunk = list(qs[:size])
+        if not chunk:
+            return
+        yield chunk
+        row = chunk[-1]
+        last = row[pk_key] if isinstance(row, dict) else getattr(row, pk_key)
+        if len(chunk) < size:
+            return
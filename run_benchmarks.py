@@ -0,0 +1,428 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks for the hot paths of machete.
+
+Run all of them with ``python run_benchmarks.py`` or pass the names of the
+ones you're interested in. Every benchmark verifies the optimized path
+produces the same output as the regular one before timing both.
+
+"""
+from __future__ import (unicode_literals, print_function, division,
+                        absolute_import)
+
+import atexit
+import os
+import sys
+import tempfile
+import timeit
+from collections import OrderedDict
+
+import django
+from django.conf import settings
+
+# A database file rather than an in-memory database, which every
+# connection (and so every thread) would see a different copy of
+DATABASE_FD, DATABASE_NAME = tempfile.mkstemp(suffix='.sqlite3')
+os.close(DATABASE_FD)
+atexit.register(os.remove, DATABASE_NAME)
+
+if not settings.configured:
+    settings.configure(
+        INSTALLED_APPS = (
+            'django.contrib.contenttypes',
+            'django.contrib.auth',
+            'machete',
+            'tests',
+        ),
+        DATABASES = {
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': DATABASE_NAME,
+            }
+        },
+        CACHES = {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'OPTIONS': {'MAX_ENTRIES': 100000},
+            }
+        },
+        SECRET_KEY = 'ohno',
+        ROOT_URLCONF = None
+    )
+    django.setup()
+
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def report(name, baseline, optimized):
+    print('%-28s %10.4fs %10.4fs %7.2fx' % (name, baseline, optimized,
+                                           baseline / optimized))
+
+
+def best_of(func, repeat=3, number=1):
+    return min(timeit.repeat(func, repeat=repeat, number=number))
+
+
+@benchmark
+def compiled_marshal(rows=5000):
+    """Generic ``Marshaller`` versus ``CompiledMarshaller``."""
+    from machete.vendor.marshmallow import fields
+    from machete.serializers import ContextSerializer
+    from tests.models import Post
+
+    class GenericPostSerializer(ContextSerializer):
+        TYPE = 'posts'
+        summary = fields.Method('get_summary')
+
+        class Meta:
+            model = Post
+
+        def get_summary(self, obj):
+            return obj.content[:10]
+
+    class CompiledPostSerializer(GenericPostSerializer):
+
+        class Meta:
+            model = Post
+            compiled = True
+
+    posts = [Post(pk=i, title='Post %s' % i, content='Content ' * 20,
+                  author_id=i % 10) for i in range(rows)]
+    generic = GenericPostSerializer(posts, many=True).data
+    compiled = CompiledPostSerializer(posts, many=True).data
+    assert generic == compiled, 'Compiled output differs'
+    report('compiled_marshal (%s rows)' % rows,
+           best_of(lambda: GenericPostSerializer(posts, many=True).data),
+           best_of(lambda: CompiledPostSerializer(posts, many=True).data))
+
+
+def comment_rows(rows):
+    """
+    Fills the database with ``rows`` comments and returns a compiled
+    serializer for them along with the queryset.
+
+    """
+    from django.core.management import call_command
+    from machete.vendor.marshmallow import fields
+    from machete.serializers import (ContextSerializer, LinksField,
+                                     ToOneIdField)
+    from tests.models import Comment, Person, Post
+
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+    class CommentSerializer(ContextSerializer):
+        TYPE = 'comments'
+        id = fields.Integer()
+        content = fields.String()
+        commenter = fields.String()
+        approved = fields.Boolean()
+        links = LinksField({
+            'author': ToOneIdField(relation_type='people'),
+            'post': ToOneIdField(relation_type='posts'),
+        })
+
+        class Meta:
+            compiled = True
+
+    Comment.objects.all().delete()
+    people = [Person.objects.create(name='Person %s' % i) for i in range(10)]
+    posts = [Post.objects.create(title='Post %s' % i, content='Content',
+                                 author=people[i]) for i in range(10)]
+    Comment.objects.bulk_create([
+        Comment(content='Comment %s' % i, commenter='Commenter %s' % i,
+                approved=bool(i % 2), author=people[i % 10],
+                post=posts[i % 10])
+        for i in range(rows)])
+    return CommentSerializer, Comment.objects.order_by('pk')
+
+
+@benchmark
+def values_rows(rows=10000):
+    """Serializing model instances versus ``values()`` dicts."""
+    from machete.serializers import get_values_columns
+    from tests.models import Comment
+
+    CommentSerializer, qs = comment_rows(rows)
+    columns = get_values_columns(CommentSerializer(), Comment._meta)
+
+    def instances():
+        return CommentSerializer(list(qs.all()), many=True).data
+
+    def values():
+        return CommentSerializer(list(qs.values(*columns)), many=True).data
+
+    assert instances() == values(), 'values() output differs'
+    report('values_rows (%s rows)' % rows,
+           best_of(instances), best_of(values))
+
+
+def post_rows(rows):
+    """
+    Fills the database with ``rows`` posts by 10 people, each with 2 of 5
+    tags and a comment, and returns the queryset of the posts.
+
+    """
+    from django.core.management import call_command
+    from tests.models import Comment, Person, Post, Tag
+
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    Comment.objects.all().delete()
+    Post.objects.all().delete()
+    Person.objects.all().delete()
+    Tag.objects.all().delete()
+    people = [Person.objects.create(name='Person %s' % i) for i in range(10)]
+    tags = [Tag.objects.create(name='tag-%s' % i) for i in range(5)]
+    Post.objects.bulk_create([
+        Post(title='Post %s' % i, content='Lorem ipsum dolor sit amet ' * 10,
+             author=people[i % 10]) for i in range(rows)])
+    qs = Post.objects.order_by('pk')
+    Through = Post.tags.through
+    Through.objects.bulk_create([
+        Through(post_id=pk, tag=tags[(pk + t) % 5])
+        for pk in qs.values_list('pk', flat=True) for t in range(2)])
+    Comment.objects.bulk_create([
+        Comment(content='Comment', commenter='Commenter', post_id=pk)
+        for pk in qs.values_list('pk', flat=True)])
+    return qs
+
+
+@benchmark
+def fragment_cache(rows=10000):
+    """Marshalling every row versus a warm ``FragmentCache``."""
+    from machete.caching import FragmentCache
+    from machete.vendor.marshmallow import fields
+    from machete.serializers import (ContextSerializer, JsonApiSerializer,
+                                     LinksField, ToOneIdField, ToManyIdField)
+
+    class PostSerializer(ContextSerializer):
+        TYPE = 'posts'
+        id = fields.Integer()
+        title = fields.String()
+        summary = fields.Method('get_summary')
+        links = LinksField({
+            'author': ToOneIdField(relation_type='people'),
+            'tags': ToManyIdField(relation_type='tags'),
+            'comments': ToManyIdField(relation_type='comments'),
+        })
+
+        class Meta:
+            compiled = True
+
+        def get_summary(self, obj):
+            return ' '.join(obj.content.split()[:5])
+
+    qs = post_rows(rows)
+    # The pk stands in for a version column, the rows don't change
+    cache = FragmentCache('pk', key_prefix='benchmark')
+    document = JsonApiSerializer('posts', fragment_cache=cache)
+
+    def uncached():
+        return PostSerializer(list(qs.all()), many=True).data
+
+    def cached():
+        kwargs = {'many': True, 'context': {}}
+        return document.marshal_fragments(PostSerializer, list(qs.all()),
+                                          kwargs)[1]
+
+    assert uncached() == cached(), 'Cached output differs'
+    report('fragment_cache (%s rows)' % rows,
+           best_of(uncached), best_of(cached))
+    stats = cache.stats()
+    print('%-28s %10.1f%% hits %9.4fs saved' % (
+        '', stats['ratio'] * 100, stats['saved']))
+
+
+@benchmark
+def concurrent_linked(rows=20000, clients=4, requests=5):
+    """
+    Sync related GETs versus GETs overlapping the ETag query with the fetch
+    of the parent row on an ``Executor``.
+
+    """
+    import threading
+    from django.db import close_old_connections
+    from django.db.models import Count, Max
+    from django.test import RequestFactory
+    from machete.concurrency import Executor
+    from machete.endpoints import GetLinkedEndpoint
+    from machete.etags import AggregateETag
+    from machete.vendor.marshmallow import class_registry, fields
+    from machete.serializers import ContextSerializer
+    from tests.models import Post
+
+    qs = post_rows(rows)
+    pk = qs.values_list('pk', flat=True)[rows // 2]
+
+    class CommentSerializer(ContextSerializer):
+        TYPE = 'benchmark-comments'
+        id = fields.Integer()
+        content = fields.String()
+        commenter = fields.String()
+
+        class Meta:
+            compiled = True
+
+    class_registry.register('benchmark-comments', CommentSerializer)
+
+    class PostComments(GetLinkedEndpoint):
+        resource_name = 'posts'
+        relationship_name = 'comments'
+        model = Post
+        etag_strategy = AggregateETag(Max('title'), Count('pk'))
+
+        def get_resource_type(self):
+            return 'benchmark-comments'
+
+    class OverlappingPostComments(PostComments):
+        executor = Executor(max_workers=clients)
+
+    factory = RequestFactory()
+
+    def get(view):
+        response = view(factory.get('/posts/%s/links/comments' % pk),
+                        pks=str(pk))
+        return response['ETag'], response.content
+
+    def load(view):
+        def client():
+            try:
+                for i in range(requests):
+                    get(view)
+            finally:
+                close_old_connections()
+        threads = [threading.Thread(target=client) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    sync = PostComments.as_view()
+    overlapping = OverlappingPostComments.as_view()
+    assert get(sync) == get(overlapping), 'Overlapping output differs'
+    report('concurrent_linked (%sx%s GETs)' % (clients, requests),
+           best_of(lambda: load(sync)), best_of(lambda: load(overlapping)))
+    OverlappingPostComments.executor.shutdown()
+
+
+@benchmark
+def parallel_linked(rows=2000):
+    """Fetching linked types one by one versus on an ``Executor``."""
+    from machete.concurrency import Executor
+    from machete.vendor.marshmallow import class_registry, fields
+    from machete.serializers import (ContextSerializer, JsonApiSerializer,
+                                     LinksField, ToOneIdField, ToManyIdField)
+    from tests.models import Comment, Person, Tag
+
+    qs = post_rows(rows)
+
+    class PersonSerializer(ContextSerializer):
+        TYPE = 'benchmark-people'
+        id = fields.Integer()
+        name = fields.String()
+
+    class TagSerializer(ContextSerializer):
+        TYPE = 'benchmark-tags'
+        id = fields.String(attribute='name')
+
+    class CommentSerializer(ContextSerializer):
+        TYPE = 'benchmark-comments'
+        id = fields.Integer()
+        content = fields.String()
+        commenter = fields.String()
+        links = LinksField({
+            'post': ToOneIdField(relation_type='benchmark-posts'),
+        })
+
+    class PostSerializer(ContextSerializer):
+        TYPE = 'benchmark-posts'
+        id = fields.Integer()
+        title = fields.String()
+        links = LinksField({
+            'author': ToOneIdField(relation_type='benchmark-people',
+                                   model=Person),
+            'tags': ToManyIdField(relation_type='benchmark-tags',
+                                  pk_field='name', model=Tag),
+            'comments': ToManyIdField(relation_type='benchmark-comments',
+                                      model=Comment),
+        })
+
+    for serializer_class in (PersonSerializer, TagSerializer,
+                             CommentSerializer, PostSerializer):
+        class_registry.register(serializer_class.TYPE, serializer_class)
+    executor = Executor(max_workers=3)
+    posts = PostSerializer(list(qs), many=True)
+    data = posts.data
+
+    def linked(executor=None):
+        document = JsonApiSerializer('benchmark-posts', compound=True,
+                                     executor=executor)
+        x, ids_by_name = document.collect_ids(data, posts)
+        return document.serialize_linked(posts, ids_by_name)
+
+    assert linked() == linked(executor), 'Parallel output differs'
+    report('parallel_linked (%s rows)' % rows,
+           best_of(linked), best_of(lambda: linked(executor)))
+    executor.shutdown()
+
+
+def realistic_document(rows):
+    import datetime
+    import decimal
+    from django.utils import timezone
+    now = timezone.now()
+    posts = []
+    for i in range(rows):
+        posts.append(OrderedDict([
+            ('id', '%s' % i),
+            ('title', 'Post number %s' % i),
+            ('content', 'Lorem ipsum dolor sit amet, ' * 10),
+            ('published', now - datetime.timedelta(hours=i)),
+            ('day', datetime.date(2014, 1, 1) + datetime.timedelta(days=i % 300)),
+            ('price', decimal.Decimal('%s.95' % i)),
+            ('links', {
+                'author': '%s' % (i % 50),
+                'tags': ['tag-%s' % t for t in range(i % 5)],
+                'comments': ['%s' % (i * 10 + c) for c in range(i % 7)],
+            }),
+        ]))
+    return OrderedDict([
+        ('links', {'posts.author': {'href': 'http://example.com/people/{posts.author}', 'type': 'people'}}),
+        ('posts', posts),
+    ])
+
+
+@benchmark
+def json_backends(rows=5000):
+    """Indented stdlib output (the former default) versus the backends."""
+    from django.core.exceptions import ImproperlyConfigured
+    from machete import json
+
+    data = realistic_document(rows)
+    expected = json.loads(json.dumps(data, indent=2, backend='stdlib'))
+    baseline = best_of(lambda: json.dumps(data, indent=2, backend='stdlib'))
+    for name in ('stdlib', 'simplejson'):
+        try:
+            json.get_backend(name)
+        except ImproperlyConfigured:
+            print('%-28s not installed' % name)
+            continue
+        encoded = json.dumps(data, backend=name)
+        assert json.loads(encoded) == expected, '%s output differs' % name
+        report('json %s (%s rows)' % (name, rows), baseline,
+               best_of(lambda: json.dumps(data, backend=name)))
+        print('%-28s %10s bytes vs %s indented' % (
+            '', len(encoded), len(json.dumps(data, indent=2, backend='stdlib'))))
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS.keys())
+    print('%-28s %11s %11s %8s' % ('benchmark', 'baseline', 'optimized',
+                                   'speedup'))
+    for name in names:
+        BENCHMARKS[name]()
@@ -9,7 +9,7 @@ setup(
     url='https://github.com/roam/machete',
     install_requires=['Django>=1.8'],
     include_package_data=True,
-    packages=['machete'],
+    packages=['machete', 'machete.management', 'machete.management.commands'],
     license='BSD',
     description='Django-based JSON API library',
     long_description=open('README.rst').read(),
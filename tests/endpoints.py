@@ -4,8 +4,8 @@ from __future__ import (unicode_literals, print_function, division,
 
 from machete.endpoints import Endpoint, GetEndpoint, GetLinkedEndpoint
 
-from .forms import PostForm
-from .models import Post, Person, Comment, Tag
+from .forms import PostForm, NoteForm
+from .models import Post, Person, Comment, Tag, Note
 from .serializers import PostSerializer  # Import needed to ensure the serializer has been registered
 
 
@@ -45,3 +45,10 @@ class Tags(GetEndpoint):
     resource_name = 'tags'
     model = Tag
     pk_field = 'name'
+
+
+class Notes(Endpoint):
+    resource_name = 'notes'
+    model = Note
+    form_class = NoteForm
+    bulk_update = True
@@ -4,7 +4,7 @@ from __future__ import (unicode_literals, print_function, division,
 
 from django import forms
 
-from .models import Post
+from .models import Post, Note
 
 
 class PostForm(forms.ModelForm):
@@ -12,3 +12,10 @@ class PostForm(forms.ModelForm):
     class Meta:
         model = Post
         fields = ('title', 'content', 'author')
+
+
+class NoteForm(forms.ModelForm):
+
+    class Meta:
+        model = Note
+        fields = ('title',)
@@ -31,3 +31,8 @@ class Comment(models.Model):
     post = models.ForeignKey(Post, related_name='comments')
     author = models.ForeignKey(Person, blank=True, null=True)
     approved = models.BooleanField(default=False)
+
+
+class Note(models.Model):
+    title = models.CharField(max_length=200)
+    updated_at = models.DateTimeField(auto_now=True)
@@ -6,7 +6,7 @@ from machete.vendor.marshmallow import fields, class_registry
 from machete.serializers import (ContextSerializer, LinksField, ToOneIdField,
                                  ToManyIdField, AutoHrefField)
 
-from .models import Post
+from .models import Post, Comment, Note
 
 
 class TagSerializer(ContextSerializer):
@@ -53,8 +53,20 @@ class PostSerializer(ContextSerializer):
     def approved_comments(self, obj, context=None):
         return obj.get_approved_comments()
 
+    def approved_comments_batch(self, objs, context=None):
+        qs = Comment.objects.filter(post__in=objs, approved=True)
+        return qs.values_list('post', 'pk')
+
+
+class NoteSerializer(ContextSerializer):
+    TYPE = 'notes'
+
+    class Meta:
+        model = Note
+
 
 class_registry.register('tags', TagSerializer)
 class_registry.register('people', AuthorSerializer)
 class_registry.register('comments', CommentSerializer)
 class_registry.register('posts', PostSerializer)
+class_registry.register('notes', NoteSerializer)
@@ -1,3 +1,79 @@
-from django.test import TestCase
+# -*- coding: utf-8 -*-
+from __future__ import (unicode_literals, print_function, division,
+                        absolute_import)
 
-# Create your tests here.
+import io
+import datetime
+from collections import namedtuple
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from machete import json
+
+from .models import Note
+
+
+Point = namedtuple('Point', ['x', 'y'])
+
+
+class Tagged(object):
+
+    def for_json(self):
+        return 'tagged'
+
+
+class JsonBackendTests(TestCase):
+
+    def assertSameEncoding(self, data):
+        expected = json.dumps(data, backend='stdlib')
+        self.assertEqual(json.dumps(data, backend='simplejson'), expected)
+
+    @skipUnless(json.SimplejsonBackend().is_available(),
+                'simplejson is not installed')
+    def test_namedtuple_is_an_array(self):
+        data = [Point(1, 2), {'points': [Point(3, 4)]}]
+        self.assertEqual(json.dumps(data, backend='simplejson'),
+                         '[[1,2],{"points":[[3,4]]}]')
+        self.assertSameEncoding(data)
+
+    @skipUnless(json.SimplejsonBackend().is_available(),
+                'simplejson is not installed')
+    def test_for_json_is_ignored(self):
+        with self.assertRaises(TypeError):
+            json.dumps({'value': Tagged()}, backend='simplejson')
+
+
+@override_settings(ROOT_URLCONF='tests.urls')
+class BulkUpdateTests(TestCase):
+
+    def test_bulk_update_bumps_auto_now(self):
+        notes = [Note.objects.create(title='note %d' % i) for i in range(3)]
+        past = datetime.datetime(2000, 1, 1)
+        Note.objects.update(updated_at=past)
+        pks = ['%s' % note.pk for note in notes]
+        body = json.dumps({'notes': [{'id': pks[0], 'title': 'changed'},
+                                     {'id': pks[1], 'title': 'note 1'}]})
+        response = self.client.put('/notes/%s' % ','.join(pks[:2]), body,
+                                   content_type='application/json')
+        self.assertIn(response.status_code, (200, 204))
+        updated = dict((n.pk, n) for n in Note.objects.all())
+        self.assertEqual(updated[notes[0].pk].title, 'changed')
+        self.assertGreater(updated[notes[0].pk].updated_at, past)
+        self.assertGreater(updated[notes[1].pk].updated_at, past)
+        self.assertEqual(updated[notes[2].pk].updated_at, past)
+
+
+class ExportNdjsonTests(TestCase):
+
+    def test_writes_to_command_stdout(self):
+        for i in range(3):
+            Note.objects.create(title='note %d' % i)
+        stdout = io.BytesIO()
+        call_command('export_ndjson', 'notes', chunk_size=2, stdout=stdout,
+                     stderr=io.BytesIO())
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual([json.loads(line)['title'] for line in lines],
+                         ['note 0', 'note 1', 'note 2'])
@@ -3,7 +3,8 @@ from __future__ import (unicode_literals, print_function, division,
                         absolute_import)
 
 from machete.urls import patterns_for
-from .endpoints import Posts, PostComments, PostAuthor, People, Comments, Tags
+from .endpoints import (Posts, PostComments, PostAuthor, People, Comments,
+                        Tags, Notes)
 
 
 urlpatterns = patterns_for(Posts)
@@ -12,3 +13,4 @@ urlpatterns += patterns_for(PostAuthor)
 urlpatterns += patterns_for(Comments)
 urlpatterns += patterns_for(Tags)
 urlpatterns += patterns_for(People)
+urlpatterns += patterns_for(Notes)